@@ -0,0 +1,126 @@
+# admission.py - 公开写接口的准入控制（令牌桶限流 + 并发上限）
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import jsonify, request
+
+from metrics import metrics
+
+class RouteLimit:
+    """一个接口的限流规则和当前状态"""
+
+    def __init__(self, name, rate, burst, concurrency):
+        self.name = name
+        self.rate = rate  # 每个客户端每秒补充的令牌数
+        self.burst = burst  # 每个客户端最多积攒的令牌数
+        self.concurrency = concurrency  # 所有客户端同时处理的请求数上限，0表示不限制
+        self.slots = threading.BoundedSemaphore(concurrency) if concurrency > 0 else None
+        self.buckets = OrderedDict()  # 客户端 -> [令牌数, 上次更新时间]，按最近访问排序
+
+class AdmissionController:
+    """进程内的准入控制
+
+    - 每个接口、每个客户端一个令牌桶：以 rate 个/秒补充，最多 burst 个，
+      没有令牌时立即返回429并在 Retry-After 中给出需要等待的秒数
+    - 每个接口有全局并发上限，已满时立即返回503，不排队等待
+    - 令牌桶按最近访问顺序保存，空闲超过 idle_ttl 秒或总数超过 max_clients 时淘汰最旧的，
+      内存占用有上限（淘汰的桶再出现时按满桶处理，与空闲足够久的结果相同）
+
+    计数在每个工作进程内独立，多进程部署时实际上限约为配置值乘以进程数。
+    """
+
+    def __init__(self, enabled=True, max_clients=10000, idle_ttl=600, trust_forwarded=False):
+        self.enabled = enabled
+        self.max_clients = max_clients
+        self.idle_ttl = idle_ttl
+        self.trust_forwarded = trust_forwarded
+        self.routes = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """从应用配置中读取开关、令牌桶容量和各接口的规则"""
+        self.enabled = app.config.get('ADMISSION_ENABLED', self.enabled)
+        self.max_clients = app.config.get('ADMISSION_MAX_CLIENTS', self.max_clients)
+        self.idle_ttl = app.config.get('ADMISSION_IDLE_TTL', self.idle_ttl)
+        self.trust_forwarded = app.config.get('ADMISSION_TRUST_FORWARDED', self.trust_forwarded)
+        with self._lock:
+            self.routes = {
+                name: RouteLimit(name, rate, burst, concurrency)
+                for name, (rate, burst, concurrency) in app.config.get('ADMISSION_RULES', {}).items()
+            }
+        metrics.register_gauge(
+            "admission.buckets",
+            lambda: sum(len(route.buckets) for route in self.routes.values())
+        )
+
+    def client_key(self):
+        """识别客户端：默认使用连接的IP，部署在反向代理之后时可信任 X-Forwarded-For"""
+        if self.trust_forwarded and request.access_route:
+            return request.access_route[0]
+        return request.remote_addr or "unknown"
+
+    def _take_token(self, route, client):
+        """尝试从客户端的令牌桶中取出一个令牌，返回需要等待的秒数（0表示放行）"""
+        now = time.monotonic()
+        with self._lock:
+            buckets = route.buckets
+            # 淘汰空闲过久的桶
+            while buckets:
+                oldest = next(iter(buckets.values()))
+                if now - oldest[1] <= self.idle_ttl:
+                    break
+                buckets.popitem(last=False)
+
+            bucket = buckets.get(client)
+            if bucket is None:
+                bucket = [float(route.burst), now]
+                buckets[client] = bucket
+                while len(buckets) > self.max_clients:
+                    buckets.popitem(last=False)
+            else:
+                bucket[0] = min(route.burst, bucket[0] + (now - bucket[1]) * route.rate)
+                bucket[1] = now
+                buckets.move_to_end(client)
+
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            return (1 - bucket[0]) / route.rate if route.rate > 0 else self.idle_ttl
+
+    @staticmethod
+    def _reject(message, status, retry_after):
+        response = jsonify({"message": message})
+        response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+        return response, status
+
+    def limit(self, name):
+        """视图装饰器：按 ADMISSION_RULES[name] 的规则限流，没有配置规则的接口不限制"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                route = self.routes.get(name)
+                if not self.enabled or route is None:
+                    return view(*args, **kwargs)
+
+                wait = self._take_token(route, self.client_key())
+                if wait > 0:
+                    metrics.incr(f"admission.{name}.throttled")
+                    return self._reject("请求过于频繁，请稍后再试", 429, wait)
+
+                if route.slots is not None and not route.slots.acquire(blocking=False):
+                    metrics.incr(f"admission.{name}.shed")
+                    return self._reject("服务器繁忙，请稍后再试", 503, 1)
+                try:
+                    metrics.incr(f"admission.{name}.admitted")
+                    return view(*args, **kwargs)
+                finally:
+                    if route.slots is not None:
+                        route.slots.release()
+            return wrapper
+        return decorator
+
+# 创建默认准入控制实例
+admission = AdmissionController()
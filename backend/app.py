@@ -1,22 +1,30 @@
+import csv
 import sqlite3
 from flask import Flask, jsonify, request, session, Response
 from flask_cors import CORS
 from database import get_connection, init_db, db
 from config import get_config
-import psycopg2
-import psycopg2.extras
+from pagination import encode_cursor, decode_cursor, page_args
+from cache import catalog_cache
+from postgres import pg_pool
+from guards import guards_snapshot
+from image_proxy import image_cache, host_allowed
+from metrics import metrics
+from uploads import upload_store, upload_variants
+from prize_draw import prize_draw
+from static_assets import static_assets
+from compression import compressor, match_etag
+from write_behind import cotton_candy_queue, QueueFull
+from notifications import cotton_candy_notifier, TooManySubscribers
+from admission import admission
+from export import FORMATS as EXPORT_FORMATS, export_rows, gzip_stream
+from song_import import SongImporter, validate_song, detect_format, iter_csv, iter_jsonl
+from serialization import ORJSONProvider, columns, rows_to_dicts, row_to_dict, SONG_FIELDS, COTTON_CANDY_FIELDS
 from datetime import datetime
-import requests
 
 import os
-import time
-from flask import Flask, jsonify, request, session, send_from_directory, render_template
-from werkzeug.utils import secure_filename
-
-# 应用配置
-UPLOAD_FOLDER = 'uploads'
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+import base64
+from flask import Flask, jsonify, request, session, send_from_directory, send_file, render_template
 
 def create_app(config_object=None):
     """
@@ -25,7 +33,8 @@ def create_app(config_object=None):
     Args:
         config_object: 配置对象或字典
     """
-    app = Flask(__name__, static_folder='build/static', template_folder='build')
+    # build/ 下的所有文件（包括 static/）统一由 static_assets 提供
+    app = Flask(__name__, static_folder=None, template_folder='build')
     
     # 加载配置
     if config_object is None:
@@ -33,19 +42,52 @@ def create_app(config_object=None):
     
     app.config.from_object(config_object)
     
+    # 使用 orjson 序列化JSON（未安装时回退到标准库）
+    app.json = ORJSONProvider(app)
+    
     # 确保上传目录存在
-    if not os.path.exists(app.config['UPLOAD_FOLDER']):
-        os.makedirs(app.config['UPLOAD_FOLDER'])
+    upload_store.init_app(app)
+    upload_variants.init_app(app)
+    
+    # 服务端抽奖引擎
+    prize_draw.init_app(app)
+    
+    # 前端构建产物的文件清单
+    static_assets.init_app(app)
     
     # 启用CORS
     CORS(app, supports_credentials=True)
     
-    # 初始化数据库
+    # 初始化数据库：设置数据库路径和连接池，并在请求结束时归还连接
+    db.init_app(app)
     with app.app_context():
-        # 设置数据库路径
-        db.db_path = app.config.get('DB_PATH', 'songs.db')
         init_db(reset=False)
     
+    # 歌曲目录缓存
+    catalog_cache.init_app(app)
+    
+    # PostgreSQL连接池（首次使用时才建立连接）
+    pg_pool.init_app(app)
+    
+    # 舰长信息快照，由后台线程定期刷新
+    guards_snapshot.init_app(app)
+    
+    # 图片代理的本地磁盘缓存
+    image_cache.init_app(app)
+    
+    # 棉花糖的批量延迟写入（可选），每批写入后通知推送服务
+    cotton_candy_queue.init_app(app)
+    cotton_candy_queue.on_flush = lambda batch: cotton_candy_notifier.wake()
+    
+    # 棉花糖未读数量的实时推送
+    cotton_candy_notifier.init_app(app)
+    
+    # 公开写接口的限流和并发上限
+    admission.init_app(app)
+    
+    # 按 Accept-Encoding 压缩JSON等文本响应
+    compressor.init_app(app)
+    
     # 注册路由和视图函数
     register_routes(app)
     
@@ -59,16 +101,44 @@ def register_routes(app):
         app: Flask应用实例
     """
     
+    def export_response(name, query, fields, converters=None):
+        """以流式响应导出查询结果，查询参数 format=ndjson|csv，compress=gzip 时边导出边压缩"""
+        fmt = request.args.get("format", "ndjson").lower()
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({"message": "仅支持 ndjson 或 csv 格式"}), 400
+        mimetype, extension = EXPORT_FORMATS[fmt]
+        
+        chunks = export_rows(
+            query, (), fields, fmt, app.json.dumps_bytes, converters,
+            batch_size=app.config.get("EXPORT_BATCH_SIZE", 500)
+        )
+        filename = f"{name}-{datetime.now().strftime('%Y%m%d%H%M%S')}{extension}"
+        if request.args.get("compress") == "gzip":
+            chunks = gzip_stream(chunks, app.config.get("EXPORT_GZIP_LEVEL", 6))
+            mimetype = "application/gzip"
+            filename += ".gz"
+        
+        # 不设置 Content-Length，由服务器使用分块传输编码
+        response = Response(chunks, mimetype=mimetype)
+        response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+        response.headers["Cache-Control"] = "no-store"
+        response.headers["X-Accel-Buffering"] = "no"
+        return response
+    
+    def catalog_response(body, etag, status=200):
+        """返回歌曲目录数据，附带基于目录版本号的ETag"""
+        response = Response(body, status=status, mimetype="application/json")
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+    
     # 前端静态文件服务
     @app.route('/', defaults={'path': ''})
     @app.route('/<path:path>')
     def serve_frontend(path):
-        if path != "" and os.path.exists(os.path.join('build', path)):
-            # 如果请求的文件存在于 build/ 下，就直接返回该文件
-            return send_from_directory('build', path)
-        else:
-            # 否则返回 index.html，让前端路由来处理
-            return send_from_directory('build', 'index.html')
+        # 文件存在于 build/ 清单中就直接返回（可能是预压缩版本），
+        # 否则返回内存中的 index.html，让前端路由来处理
+        return static_assets.serve(path)
     
     # 用户奖品相关API
     @app.route("/api/user/prizes", methods=["GET"])
@@ -98,19 +168,11 @@ def register_routes(app):
             SELECT id, name, probability, image
             FROM prizes
             WHERE user_id = ?
+            ORDER BY id
         """, (user_id,))
-        rows = cur.fetchall()
+        prizes = rows_to_dicts(cur, cur.fetchall())
         conn.close()
 
-        # 格式化返回
-        prizes = []
-        for r in rows:
-            prizes.append({
-                "id": r["id"],
-                "name": r["name"],
-                "probability": r["probability"],
-                "image": r["image"]
-            })
         return jsonify(prizes), 200
 
     @app.route("/api/user/prizes", methods=["POST"])
@@ -118,8 +180,10 @@ def register_routes(app):
         """
         保存用户奖品数据：
         - 如果未登录返回 401
-        - 数据格式: { prizes: [{ name, probability, image }] }
-        - 清空该用户之前所有奖品并插入新的
+        - 数据格式: { prizes: [{ id, name, probability, image }] }
+        - 与已保存的奖品对比：带已有 id 的奖品原地更新，没有 id 的新增，
+          不再出现的删除；所有改动在一个事务中完成，未改动的奖品 id 保持不变
+        - 返回各类改动的数量以及保存后的奖品列表
         """
         if "username" not in session:
             return jsonify({"message": "请先登录"}), 401
@@ -139,10 +203,18 @@ def register_routes(app):
         
         user_id = user_row["id"]
         
-        # 清空该用户现有奖品
-        cur.execute("DELETE FROM prizes WHERE user_id = ?", (user_id,))
+        # 在一个写事务中读取现有奖品并应用差异
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("""
+            SELECT id, name, probability, image
+            FROM prizes
+            WHERE user_id = ?
+        """, (user_id,))
+        existing = {row["id"]: (row["name"], row["probability"], row["image"]) for row in cur.fetchall()}
         
-        # 插入新的奖品数据
+        inserts = []
+        updates = []
+        kept_ids = set()
         for prize in prizes:
             name = prize.get("name", "").strip()
             probability = float(prize.get("probability", 0))
@@ -151,15 +223,114 @@ def register_routes(app):
             if not name:
                 continue
             
-            cur.execute("""
-                INSERT INTO prizes (user_id, name, probability, image)
-                VALUES (?, ?, ?, ?)
-            """, (user_id, name, probability, image))
-
+            # 前端可能传来字符串形式的id；无法识别的id按新奖品处理
+            prize_id = prize.get("id")
+            if isinstance(prize_id, str) and prize_id.strip().isdigit():
+                prize_id = int(prize_id)
+            elif not isinstance(prize_id, int) or isinstance(prize_id, bool):
+                prize_id = None
+            if prize_id in existing and prize_id not in kept_ids:
+                kept_ids.add(prize_id)
+                if existing[prize_id] != (name, probability, image):
+                    updates.append((name, probability, image, prize_id, user_id))
+            else:
+                inserts.append((user_id, name, probability, image))
+        
+        deletes = [(prize_id, user_id) for prize_id in existing if prize_id not in kept_ids]
+        
+        cur.executemany("DELETE FROM prizes WHERE id = ? AND user_id = ?", deletes)
+        cur.executemany("""
+            UPDATE prizes SET name = ?, probability = ?, image = ?
+            WHERE id = ? AND user_id = ?
+        """, updates)
+        cur.executemany("""
+            INSERT INTO prizes (user_id, name, probability, image)
+            VALUES (?, ?, ?, ?)
+        """, inserts)
         conn.commit()
+        
+        # 返回保存后的奖品，前端据此拿到新增奖品的 id
+        cur.execute("""
+            SELECT id, name, probability, image
+            FROM prizes
+            WHERE user_id = ?
+            ORDER BY id
+        """, (user_id,))
+        saved = rows_to_dicts(cur, cur.fetchall())
         conn.close()
+        
+        if deletes or updates or inserts:
+            # 奖品变化后需要重建抽奖用的别名表
+            prize_draw.invalidate(user_id)
+
+        return jsonify({
+            "message": "奖品信息已保存",
+            "inserted": len(inserts),
+            "updated": len(updates),
+            "deleted": len(deletes),
+            "unchanged": len(kept_ids) - len(updates),
+            "prizes": saved
+        }), 200
 
-        return jsonify({"message": "奖品信息已保存"}), 200
+    @app.route("/api/user/prizes/draw", methods=["POST"])
+    def draw_user_prizes():
+        """
+        按当前登录用户的奖品概率在服务端抽奖
+        - 如果未登录返回 401
+        - 数据格式: { n: 抽取次数(默认1), seed: 随机种子(可选, 整数) }
+        - 返回 { prizes: 可能的结果, draws: 每次抽中的结果下标, counts: 各结果的次数 }
+        """
+        if "username" not in session:
+            return jsonify({"message": "请先登录"}), 401
+        
+        data = request.get_json() or {}
+        n = data.get("n", 1)
+        seed = data.get("seed")
+        max_draws = app.config.get("PRIZE_DRAW_MAX", 100000)
+        
+        if not isinstance(n, int) or isinstance(n, bool) or n < 1 or n > max_draws:
+            return jsonify({"message": f"抽取次数必须是1到{max_draws}之间的整数"}), 400
+        if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool)):
+            return jsonify({"message": "随机种子必须是整数"}), 400
+        
+        conn = get_connection()
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM users WHERE username = ?", (session["username"],))
+        user_row = cur.fetchone()
+        if not user_row:
+            conn.close()
+            return jsonify({"message": "用户不存在"}), 404
+        
+        user_id = user_row["id"]
+        
+        def load_prizes():
+            cur.execute("""
+                SELECT id, name, probability, image
+                FROM prizes
+                WHERE user_id = ?
+                ORDER BY id
+            """, (user_id,))
+            return cur.fetchall()
+        
+        table = prize_draw.get_table(user_id, load_prizes)
+        conn.close()
+        
+        if all(outcome["id"] is None for outcome in table.outcomes):
+            return jsonify({"message": "请先设置奖品"}), 400
+        
+        draws = prize_draw.draw(table, n, seed)
+        counts = [0] * len(table.outcomes)
+        for index in draws:
+            counts[index] += 1
+        
+        result = {
+            "prizes": table.outcomes,
+            "draws": draws,
+            "counts": counts
+        }
+        if n == 1:
+            result["prize"] = table.outcomes[draws[0]]
+        return jsonify(result), 200
 
     # 用户认证相关API
     @app.route("/api/login", methods=["POST"])
@@ -206,6 +377,7 @@ def register_routes(app):
         return jsonify({"message": "已登出"}), 200
 
     @app.route("/api/register", methods=["POST"])
+    @admission.limit("register")
     def register():
         """
         注册新用户
@@ -276,6 +448,7 @@ def register_routes(app):
 
     # 文件上传相关API
     @app.route("/api/upload", methods=["POST"])
+    @admission.limit("upload")
     def upload_image():
         """
         处理图片上传
@@ -292,21 +465,10 @@ def register_routes(app):
             return jsonify({"message": "未选择文件"}), 400
         
         if file:
-            # 安全处理文件名
-            filename = secure_filename(file.filename)
-            # 添加时间戳前缀避免重名
-            timestamp = int(time.time())
-            filename = f"{timestamp}_{filename}"
+            # 按内容哈希保存，相同图片只存一份
+            filename = upload_store.save(file)
             
-            # 确保上传目录存在
-            if not os.path.exists(UPLOAD_FOLDER):
-                os.makedirs(UPLOAD_FOLDER)
-            
-            # 保存文件
-            file_path = os.path.join(UPLOAD_FOLDER, filename)
-            file.save(file_path)
-            
-            # 返回可访问的URL
+            # 返回可访问的URL（由内容决定，内容不变URL就不变）
             file_url = f"/uploads/{filename}"
             return jsonify({"url": file_url}), 200
         
@@ -314,8 +476,40 @@ def register_routes(app):
 
     @app.route("/uploads/<path:filename>")
     def serve_uploaded_file(filename):
-        """提供上传文件的访问"""
-        return send_from_directory(UPLOAD_FOLDER, filename)
+        """
+        提供上传文件的访问，内容寻址的文件可以永久缓存
+        查询参数:
+        - w: 返回不超过该宽度的缩小版本（向上取到 UPLOAD_VARIANT_WIDTHS 中的档位）
+        - format: 转换格式 webp/jpeg/png，不带 w 时保持原图尺寸
+        """
+        if filename.startswith(".tmp/"):
+            # 正在写入的临时文件不对外提供
+            return jsonify({"message": "文件不存在"}), 404
+        
+        content_hash = upload_store.content_hash(filename)
+        etag = content_hash
+        
+        # 按需生成缩略图，只针对内容寻址的原图；生成失败或未完成时返回原图
+        width = request.args.get("w", type=int)
+        fmt = request.args.get("format")
+        if content_hash is not None and ((width and width > 0) or fmt):
+            variant = upload_variants.get(filename, width if width and width > 0 else None, fmt)
+            if variant is not None:
+                filename = variant
+                etag = f"{content_hash}-{os.path.basename(variant).split('.', 1)[1]}"
+        
+        if content_hash is None:
+            # 旧的时间戳文件名
+            return send_from_directory(upload_store.folder, filename)
+        
+        response = send_from_directory(
+            upload_store.folder,
+            filename,
+            etag=etag,
+            max_age=31536000
+        )
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
 
     # 用户管理相关API
     @app.route("/api/users", methods=["GET"])
@@ -333,16 +527,7 @@ def register_routes(app):
             FROM users
             ORDER BY id
         """)
-        
-        users = []
-        for row in cur.fetchall():
-            users.append({
-                "id": row["id"],
-                "username": row["username"],
-                "bilibili_uid": row["bilibili_uid"],
-                "is_admin": row["is_admin"]
-            })
-        
+        users = rows_to_dicts(cur, cur.fetchall())
         conn.close()
         return jsonify(users), 200
 
@@ -413,95 +598,134 @@ def register_routes(app):
         获取歌曲列表，支持分页和搜索
         查询参数:
         - page: 页码，默认1
-        - per_page: 每页数量，默认10
+        - per_page: 每页数量，默认10，最大100
         - search: 搜索关键词，默认为空
+        - cursor: 游标分页，传空值获取第一页，之后传上一页返回的 next_cursor；
+          游标模式下按id倒序且不使用 page
+        - with_total: 游标模式下是否统计总数，默认false
         """
-        page = request.args.get("page", 1, type=int)
-        per_page = request.args.get("per_page", 10, type=int)
+        page, per_page = page_args(request.args)
         search = request.args.get("search", "")
-        
-        # 计算偏移量
-        offset = (page - 1) * per_page
+        cursor = request.args.get("cursor")
+        with_total = request.args.get("with_total", "false").lower() == "true"
+        
+        last_id = None
+        if cursor:
+            try:
+                (last_id,) = decode_cursor(cursor, 1)
+            except ValueError:
+                return jsonify({"message": "无效的分页游标"}), 400
+        
+        # 目录未变化时直接返回304或缓存的结果
+        version = catalog_cache.version
+        etag = catalog_cache.etag(version)
+        matched = match_etag(etag)
+        if matched:
+            return catalog_response(b"", matched, 304)
+        cache_key = ("songs", search, page, per_page, cursor, with_total)
+        body = catalog_cache.get(version, cache_key)
+        if body is not None:
+            return catalog_response(body, etag)
         
         conn = get_connection()
         cur = conn.cursor()
         
-        # 构建查询
-        query = "SELECT * FROM songs"
-        params = []
-        
-        if search:
-            query += """ WHERE title LIKE ? OR artist LIKE ? OR album LIKE ? OR tags LIKE ?"""
-            search_term = f"%{search}%"
-            params = [search_term, search_term, search_term, search_term]
-        
-        # 添加分页
-        query += " ORDER BY id DESC LIMIT ? OFFSET ?"
-        params.extend([per_page, offset])
-        
-        # 执行查询
-        cur.execute(query, params)
-        rows = cur.fetchall()
-        
-        # 获取总数
-        count_query = "SELECT COUNT(*) FROM songs"
-        if search:
-            count_query += """ WHERE title LIKE ? OR artist LIKE ? OR album LIKE ? OR tags LIKE ?"""
-            cur.execute(count_query, [search_term, search_term, search_term, search_term])
+        # 构建查询条件
+        use_fts = search and db.fts_enabled and len(search) >= 3
+        if use_fts:
+            # 使用全文索引搜索，按 bm25 相关度排序
+            source = "songs_fts JOIN songs ON songs.id = songs_fts.rowid"
+            conditions = ["songs_fts MATCH ?"]
+            params = ['"' + search.replace('"', '""') + '"']
+            order = "bm25(songs_fts), songs.id DESC"
         else:
-            cur.execute(count_query)
-            
-        total = cur.fetchone()[0]
+            # trigram 索引无法匹配少于3个字符的查询词，此时使用 LIKE
+            source = "songs"
+            conditions = []
+            params = []
+            if search:
+                conditions.append("(title LIKE ? OR artist LIKE ? OR album LIKE ? OR tags LIKE ?)")
+                search_term = f"%{search}%"
+                params = [search_term, search_term, search_term, search_term]
+            order = "songs.id DESC"
+        
+        if cursor is None:
+            # 偏移分页
+            where = " WHERE " + " AND ".join(conditions) if conditions else ""
+            query = f"SELECT {columns(SONG_FIELDS, 'songs')} FROM {source}{where} ORDER BY {order} LIMIT ? OFFSET ?"
+            cur.execute(query, params + [per_page, (page - 1) * per_page])
+            songs = rows_to_dicts(cur, cur.fetchall())
+        else:
+            # 游标分页：从上一页最后一条之后继续，多取一条判断是否还有下一页
+            page_conditions = list(conditions)
+            page_params = list(params)
+            if last_id is not None:
+                page_conditions.append("songs.id < ?")
+                page_params.append(last_id)
+            where = " WHERE " + " AND ".join(page_conditions) if page_conditions else ""
+            query = f"SELECT {columns(SONG_FIELDS, 'songs')} FROM {source}{where} ORDER BY songs.id DESC LIMIT ?"
+            cur.execute(query, page_params + [per_page + 1])
+            songs = rows_to_dicts(cur, cur.fetchall())
+            has_more = len(songs) > per_page
+            songs = songs[:per_page]
+        
+        # 获取总数，游标模式下只在需要时统计
+        total = None
+        if cursor is None or with_total:
+            where = " WHERE " + " AND ".join(conditions) if conditions else ""
+            count_source = "songs_fts" if use_fts else "songs"
+            cur.execute(f"SELECT COUNT(*) FROM {count_source}{where}", params)
+            total = cur.fetchone()[0]
         conn.close()
         
-        # 格式化结果
-        songs = []
-        for row in rows:
-            songs.append({
-                "id": row["id"],
-                "title": row["title"],
-                "artist": row["artist"],
-                "album": row["album"],
-                "genre": row["genre"],
-                "year": row["year"],
-                "meta_data": row["meta_data"],
-                "tags": row["tags"]
-            })
+        if cursor is not None:
+            result = {
+                "songs": songs,
+                "per_page": per_page,
+                "next_cursor": encode_cursor(songs[-1]["id"]) if has_more else None
+            }
+            if total is not None:
+                result["total"] = total
+        else:
+            result = {
+                "songs": songs,
+                "total": total,
+                "page": page,
+                "per_page": per_page,
+                "total_pages": (total + per_page - 1) // per_page
+            }
         
-        return jsonify({
-            "songs": songs,
-            "total": total,
-            "page": page,
-            "per_page": per_page,
-            "total_pages": (total + per_page - 1) // per_page
-        }), 200
+        body = app.json.dumps(result).encode("utf-8")
+        catalog_cache.set(version, cache_key, body)
+        return catalog_response(body, etag)
 
     @app.route("/api/songs/<int:song_id>", methods=["GET"])
     def get_song_by_id(song_id):
         """
         获取单个歌曲详情
         """
+        version = catalog_cache.version
+        etag = catalog_cache.etag(version)
+        matched = match_etag(etag)
+        if matched:
+            return catalog_response(b"", matched, 304)
+        cache_key = ("song", song_id)
+        body = catalog_cache.get(version, cache_key)
+        if body is not None:
+            return catalog_response(body, etag)
+        
         conn = get_connection()
         cur = conn.cursor()
-        cur.execute("SELECT * FROM songs WHERE id = ?", (song_id,))
-        row = cur.fetchone()
+        cur.execute(f"SELECT {columns(SONG_FIELDS)} FROM songs WHERE id = ?", (song_id,))
+        song = row_to_dict(cur, cur.fetchone())
         conn.close()
         
-        if not row:
+        if not song:
             return jsonify({"message": "歌曲不存在"}), 404
         
-        song = {
-            "id": row["id"],
-            "title": row["title"],
-            "artist": row["artist"],
-            "album": row["album"],
-            "genre": row["genre"],
-            "year": row["year"],
-            "meta_data": row["meta_data"],
-            "tags": row["tags"]
-        }
-        
-        return jsonify(song), 200
+        body = app.json.dumps(song).encode("utf-8")
+        catalog_cache.set(version, cache_key, body)
+        return catalog_response(body, etag)
 
     @app.route("/api/songs", methods=["POST"])
     def create_song():
@@ -512,24 +736,10 @@ def register_routes(app):
             return jsonify({"message": "需要管理员权限"}), 403
         
         data = request.get_json() or {}
-        title = data.get("title") or ""
-        title = title.strip()
-        artist = data.get("artist") or ""
-        artist = artist.strip()
-        
-        # 基本验证
-        if not title or not artist:
-            return jsonify({"message": "歌曲标题和艺术家不能为空"}), 400
-        
-        # 提取其他字段
-        album = data.get("album") or ""
-        album = album.strip()
-        genre = data.get("genre") or ""
-        genre = genre.strip()
-        year = data.get("year")
-        meta_data = data.get("meta_data", "")
-        tags = data.get("tags") or ""
-        tags = tags.strip()
+        try:
+            values = validate_song(data)
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
         
         conn = get_connection()
         cur = conn.cursor()
@@ -537,17 +747,75 @@ def register_routes(app):
         cur.execute("""
             INSERT INTO songs (title, artist, album, genre, year, meta_data, tags)
             VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (title, artist, album, genre, year, meta_data, tags))
+        """, values)
         
         conn.commit()
         song_id = cur.lastrowid
         conn.close()
+        catalog_cache.bump()
         
         return jsonify({
             "message": "歌曲创建成功",
             "id": song_id
         }), 201
 
+    @app.route("/api/songs/export", methods=["GET"])
+    def export_songs():
+        """
+        导出全部歌曲，需要管理员权限
+        查询参数 format=ndjson|csv（默认ndjson），compress=gzip 时下载 .gz 文件；
+        CSV 的列与导入接口相同，可以直接重新导入
+        """
+        if not session.get("is_admin"):
+            return jsonify({"message": "需要管理员权限"}), 403
+        
+        return export_response(
+            "songs",
+            f"SELECT {columns(SONG_FIELDS)} FROM songs ORDER BY id",
+            SONG_FIELDS
+        )
+
+    @app.route("/api/songs/import", methods=["POST"])
+    def import_songs():
+        """
+        批量导入歌曲，需要管理员权限
+        - 上传CSV（首行为表头）或JSONL文件：multipart 的 file 字段，或直接作为请求体
+        - 查询参数 format=csv|jsonl（默认按文件名或 Content-Type 判断），upsert=true 时按 (标题, 艺术家) 更新已有歌曲
+        - 返回 { total, inserted, updated, failed, duplicates, errors: [{line, message}] }
+        """
+        if not session.get("is_admin"):
+            return jsonify({"message": "需要管理员权限"}), 403
+        
+        upload = request.files.get("file")
+        if upload is not None:
+            stream = upload.stream
+            fmt = request.args.get("format") or detect_format(upload.filename, upload.content_type)
+        else:
+            stream = request.stream
+            fmt = request.args.get("format") or detect_format(content_type=request.content_type)
+        if fmt not in ("csv", "jsonl"):
+            return jsonify({"message": "仅支持CSV或JSONL格式"}), 400
+        
+        importer = SongImporter(
+            get_connection,
+            chunk_size=app.config.get("SONG_IMPORT_CHUNK_SIZE", 1000),
+            upsert=request.args.get("upsert", "false").lower() == "true",
+            max_errors=app.config.get("SONG_IMPORT_MAX_ERRORS", 1000)
+        )
+        try:
+            report = importer.run(iter_csv(stream) if fmt == "csv" else iter_jsonl(stream))
+        except (UnicodeDecodeError, csv.Error) as e:
+            # 文件编码或CSV结构错误，已经写入的批次保留
+            report = importer.report()
+            report["message"] = f"导入中止，第{importer.total + 1}行附近文件格式错误: {str(e)}"
+        else:
+            report["message"] = "歌曲导入完成"
+        finally:
+            if importer.inserted or importer.updated:
+                catalog_cache.bump()
+        
+        return jsonify(report), 200
+
     @app.route("/api/songs/<int:song_id>", methods=["PUT"])
     def update_song(song_id):
         """
@@ -594,6 +862,7 @@ def register_routes(app):
         
         conn.commit()
         conn.close()
+        catalog_cache.bump()
         
         return jsonify({
             "message": "歌曲更新成功",
@@ -621,6 +890,7 @@ def register_routes(app):
         cur.execute("DELETE FROM songs WHERE id = ?", (song_id,))
         conn.commit()
         conn.close()
+        catalog_cache.bump()
         
         return jsonify({
             "message": "歌曲已删除",
@@ -629,6 +899,7 @@ def register_routes(app):
 
     # 棉花糖相关API
     @app.route("/api/cotton_candy", methods=["POST"])
+    @admission.limit("cotton_candy")
     def create_cotton_candy():
         """
         创建新的棉花糖，任何人都可以发送
@@ -647,6 +918,21 @@ def register_routes(app):
         if not content:
             return jsonify({"message": "棉花糖内容不能为空"}), 400
         
+        if cotton_candy_queue.enabled:
+            # 延迟写入：放入队列后立即返回，由后台线程批量写入数据库
+            create_time = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+            try:
+                cotton_candy_queue.submit((data["sender"], title, content, create_time))
+            except QueueFull:
+                response = jsonify({"message": "发送的人太多了，请稍后再试"})
+                response.headers["Retry-After"] = "1"
+                return response, 429
+            return jsonify({
+                "message": "棉花糖发送成功",
+                "id": None,
+                "queued": True
+            }), 202
+        
         conn = get_connection()
         cur = conn.cursor()
         
@@ -658,6 +944,7 @@ def register_routes(app):
         conn.commit()
         candy_id = cur.lastrowid
         conn.close()
+        cotton_candy_notifier.wake()
         
         return jsonify({
             "message": "棉花糖发送成功",
@@ -669,61 +956,81 @@ def register_routes(app):
         """
         获取棉花糖列表，需要管理员权限
         支持分页和筛选已读/未读
+        查询参数:
+        - page / per_page: 偏移分页
+        - read: 已读筛选 true/false
+        - cursor: 游标分页，传空值获取第一页，之后传上一页返回的 next_cursor
+        - with_total: 游标模式下是否统计总数，默认false
         """
         if not session.get("is_admin"):
             return jsonify({"message": "需要管理员权限"}), 403
         
-        page = request.args.get("page", 1, type=int)
-        per_page = request.args.get("per_page", 10, type=int)
+        page, per_page = page_args(request.args)
         read_filter = request.args.get("read")
+        cursor = request.args.get("cursor")
+        with_total = request.args.get("with_total", "false").lower() == "true"
         
-        # 计算偏移量
-        offset = (page - 1) * per_page
+        last_key = None
+        if cursor:
+            try:
+                last_key = decode_cursor(cursor, 2)
+            except ValueError:
+                return jsonify({"message": "无效的分页游标"}), 400
         
         conn = get_connection()
         cur = conn.cursor()
         
-        # 构建查询
-        query = "SELECT * FROM cotton_candy"
+        # 构建查询条件
+        conditions = []
         params = []
         
         if read_filter is not None:
             read_value = 1 if read_filter.lower() == 'true' else 0
-            query += " WHERE read = ?"
-            params = [read_value]
-        
-        # 添加排序和分页
-        query += " ORDER BY create_time DESC LIMIT ? OFFSET ?"
-        params.extend([per_page, offset])
-        
-        # 执行查询
-        cur.execute(query, params)
-        rows = cur.fetchall()
-        
-        # 获取总数
-        count_query = "SELECT COUNT(*) FROM cotton_candy"
-        if read_filter is not None:
-            count_query += " WHERE read = ?"
-            cur.execute(count_query, [read_value])
+            conditions.append("read = ?")
+            params.append(read_value)
+        
+        if cursor is None:
+            # 偏移分页
+            where = " WHERE " + " AND ".join(conditions) if conditions else ""
+            query = f"SELECT {columns(COTTON_CANDY_FIELDS)} FROM cotton_candy{where} ORDER BY create_time DESC, id DESC LIMIT ? OFFSET ?"
+            cur.execute(query, params + [per_page, (page - 1) * per_page])
+            candies = rows_to_dicts(cur, cur.fetchall(), {"read": bool})
         else:
-            cur.execute(count_query)
-            
-        total = cur.fetchone()[0]
-        
-        # 格式化结果
-        candies = []
-        for row in rows:
-            candies.append({
-                "id": row["id"],
-                "sender": row["sender"],
-                "title": row["title"],
-                "content": row["content"],
-                "create_time": row["create_time"],
-                "read": bool(row["read"])
-            })
+            # 游标分页：按 (create_time, id) 从上一页最后一条之后继续
+            page_conditions = list(conditions)
+            page_params = list(params)
+            if last_key is not None:
+                page_conditions.append("(create_time, id) < (?, ?)")
+                page_params.extend(last_key)
+            where = " WHERE " + " AND ".join(page_conditions) if page_conditions else ""
+            query = f"SELECT {columns(COTTON_CANDY_FIELDS)} FROM cotton_candy{where} ORDER BY create_time DESC, id DESC LIMIT ?"
+            cur.execute(query, page_params + [per_page + 1])
+            candies = rows_to_dicts(cur, cur.fetchall(), {"read": bool})
+            has_more = len(candies) > per_page
+            candies = candies[:per_page]
+        
+        # 获取总数，游标模式下只在需要时统计
+        total = None
+        if cursor is None or with_total:
+            where = " WHERE " + " AND ".join(conditions) if conditions else ""
+            cur.execute(f"SELECT COUNT(*) FROM cotton_candy{where}", params)
+            total = cur.fetchone()[0]
         
         conn.close()
         
+        if cursor is not None:
+            result = {
+                "candies": candies,
+                "per_page": per_page,
+                "next_cursor": None
+            }
+            if has_more:
+                last = candies[-1]
+                result["next_cursor"] = encode_cursor(last["create_time"], last["id"])
+            if total is not None:
+                result["total"] = total
+            return jsonify(result), 200
+        
         return jsonify({
             "candies": candies,
             "total": total,
@@ -732,6 +1039,22 @@ def register_routes(app):
             "total_pages": (total + per_page - 1) // per_page
         }), 200
     
+    @app.route("/api/cotton_candy/export", methods=["GET"])
+    def export_cotton_candy():
+        """
+        导出全部棉花糖，需要管理员权限
+        查询参数同歌曲导出
+        """
+        if not session.get("is_admin"):
+            return jsonify({"message": "需要管理员权限"}), 403
+        
+        return export_response(
+            "cotton_candy",
+            f"SELECT {columns(COTTON_CANDY_FIELDS)} FROM cotton_candy ORDER BY id",
+            COTTON_CANDY_FIELDS,
+            {"read": bool}
+        )
+    
     @app.route("/api/cotton_candy/<int:candy_id>", methods=["GET"])
     def get_cotton_candy(candy_id):
         """
@@ -743,26 +1066,19 @@ def register_routes(app):
         conn = get_connection()
         cur = conn.cursor()
         
-        cur.execute("SELECT * FROM cotton_candy WHERE id = ?", (candy_id,))
-        row = cur.fetchone()
+        cur.execute(f"SELECT {columns(COTTON_CANDY_FIELDS)} FROM cotton_candy WHERE id = ?", (candy_id,))
+        candy = row_to_dict(cur, cur.fetchone())
         
-        if not row:
+        if not candy:
             conn.close()
             return jsonify({"message": "棉花糖不存在"}), 404
         
         # 标记为已读
-        if not row["read"]:
+        if not candy["read"]:
             cur.execute("UPDATE cotton_candy SET read = 1 WHERE id = ?", (candy_id,))
             conn.commit()
-        
-        candy = {
-            "id": row["id"],
-            "sender": row["sender"],
-            "title": row["title"],
-            "content": row["content"],
-            "create_time": row["create_time"],
-            "read": True  # 已读取即标记为已读
-        }
+            cotton_candy_notifier.wake()
+        candy["read"] = True  # 已读取即标记为已读
         
         conn.close()
         
@@ -789,6 +1105,7 @@ def register_routes(app):
         cur.execute("DELETE FROM cotton_candy WHERE id = ?", (candy_id,))
         conn.commit()
         conn.close()
+        cotton_candy_notifier.wake()
         
         return jsonify({
             "message": "棉花糖已删除",
@@ -819,6 +1136,7 @@ def register_routes(app):
         cur.execute(query, candy_ids)
         conn.commit()
         conn.close()
+        cotton_candy_notifier.wake()
         
         return jsonify({
             "message": "棉花糖已标记为已读",
@@ -833,91 +1151,67 @@ def register_routes(app):
         if not session.get("is_admin"):
             return jsonify({"message": "需要管理员权限"}), 403
         
-        conn = get_connection()
-        cur = conn.cursor()
-        
-        cur.execute("SELECT COUNT(*) FROM cotton_candy WHERE read = 0")
-        count = cur.fetchone()[0]
-        conn.close()
+        # 未读数量由触发器维护，这里只读取进程内的计数
+        return jsonify({"unread_count": cotton_candy_notifier.unread()}), 200
+    
+    @app.route("/api/cotton_candy/events", methods=["GET"])
+    def cotton_candy_events():
+        """
+        棉花糖事件推送（Server-Sent Events），需要管理员权限
+        连接后先收到 {type: "unread", unread}，之后每次新增/已读/删除收到
+        {type: "new"|"read"|"delete", id, unread, time}，新增事件还带有 sender 和 title
+        """
+        if request.method != "GET":
+            # Flask 为 GET 路由自动添加 HEAD，HEAD 不会读取响应体，连接名额就无法释放
+            return jsonify({"message": "不支持的请求方法"}), 405
+        if not session.get("is_admin"):
+            return jsonify({"message": "需要管理员权限"}), 403
         
-        return jsonify({"unread_count": count}), 200
+        try:
+            q = cotton_candy_notifier.subscribe()
+        except TooManySubscribers as e:
+            response = jsonify({"message": str(e)})
+            response.headers["Retry-After"] = "10"
+            return response, 503
+        
+        response = Response(cotton_candy_notifier.stream(q), mimetype="text/event-stream")
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Accel-Buffering"] = "no"  # 关闭Nginx的响应缓冲
+        # 响应体可能一次都没有被迭代（客户端在第一块之前断开），关闭响应时也要释放名额
+        response.call_on_close(lambda: cotton_candy_notifier.unsubscribe(q))
+        return response
 
     # 获取舰长信息API
     @app.route("/api/guards", methods=["GET"])
     def get_guards():
         """
         获取特定直播间的舰长信息
+        返回后台定期刷新的快照，数据库不可用时继续返回最后一次成功的结果
         """
         try:
-            # 从配置中获取数据库连接信息
-            config = get_config()
-            # 连接PostgreSQL数据库
-            conn = psycopg2.connect(
-                host=config.POSTGRES_HOST,
-                port=config.POSTGRES_PORT,
-                database=config.POSTGRES_DB,
-                user=config.POSTGRES_USER,
-                password=config.POSTGRES_PASSWORD
-            )
-            
-            # 使用DictCursor，这样可以通过列名访问结果
-            cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-            
-            # 查询特定直播间的舰长信息
-            cur.execute("""
-                SELECT id, room_id, ruid, uid, rank, accompany, 
-                       username, face, name_color, is_mystery,
-                       medal_name, medal_level, medal_color_start, 
-                       medal_color_end, medal_color_border, medal_color,
-                       guard_level, expired_str, is_top3, timestamp
-                FROM bilibili_guards 
-                WHERE room_id = 1749141031
-                ORDER BY rank ASC
-            """)
-            
-            rows = cur.fetchall()
-            
-            # 格式化结果
-            guards = []
-            for row in rows:
-                guard = {
-                    "id": row["id"],
-                    "room_id": row["room_id"],
-                    "ruid": row["ruid"],
-                    "uid": row["uid"],
-                    "rank": row["rank"],
-                    "accompany": row["accompany"],
-                    "username": row["username"],
-                    "face": row["face"],
-                    "name_color": row["name_color"],
-                    "is_mystery": row["is_mystery"],
-                    "medal_name": row["medal_name"],
-                    "medal_level": row["medal_level"],
-                    "medal_color_start": row["medal_color_start"],
-                    "medal_color_end": row["medal_color_end"],
-                    "medal_color_border": row["medal_color_border"],
-                    "medal_color": row["medal_color"],
-                    "guard_level": row["guard_level"],
-                    "expired_str": row["expired_str"],
-                    "is_top3": row["is_top3"],
-                    "timestamp": row["timestamp"].isoformat() if row["timestamp"] else None
-                }
-                guards.append(guard)
-            
-            cur.close()
-            conn.close()
-            
-            return jsonify({
-                "message": "获取舰长信息成功",
-                "total": len(guards),
-                "guards": guards
-            }), 200
-            
+            body, etag = guards_snapshot.get()
         except Exception as e:
             print(f"获取舰长信息错误: {str(e)}")  # 添加错误日志
             return jsonify({
                 "message": f"获取舰长信息失败: {str(e)}"
             }), 500
+        
+        matched = match_etag(etag)
+        response = Response(b"" if matched else body, status=304 if matched else 200, mimetype="application/json")
+        response.set_etag(matched or etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    # 运行指标API
+    @app.route("/api/metrics", methods=["GET"])
+    def get_metrics():
+        """
+        获取当前进程的运行指标（如单飞合并次数），仅管理员可用
+        """
+        if not session.get("is_admin"):
+            return jsonify({"message": "需要管理员权限"}), 403
+        
+        return jsonify(metrics.snapshot()), 200
 
     # 添加图片代理接口
     @app.route("/api/proxy/image")
@@ -930,32 +1224,99 @@ def register_routes(app):
             return jsonify({"message": "缺少图片URL"}), 400
             
         try:
-            # 设置请求头，模拟浏览器请求
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Referer': 'https://www.bilibili.com'
-            }
-            response = requests.get(image_url, headers=headers)
+            # 优先从本地磁盘缓存读取，过期时向上游重新验证
+            image = image_cache.fetch(image_url)
             
             # 返回图片数据
-            return Response(
-                response.content,
-                mimetype=response.headers['Content-Type'],
-                headers={
-                    "Cache-Control": "public, max-age=31536000",
-                    "Access-Control-Allow-Origin": "*"
-                }
+            response = send_file(
+                image.path,
+                mimetype=image.content_type,
+                etag=image.etag,
+                conditional=True
             )
         except Exception as e:
             print(f"代理图片错误: {str(e)}")
             return jsonify({"message": "获取图片失败"}), 500
+        
+        response.headers["Cache-Control"] = "public, max-age=31536000"
+        response.headers["Access-Control-Allow-Origin"] = "*"
+        return response
 
 
-# 创建应用实例
-app = create_app()
+    @app.route("/api/proxy/images", methods=["POST"])
+    def proxy_images():
+        """
+        批量代理获取图片：并发抓取并写入服务端缓存，小图片直接内联返回
+        只接受 IMAGE_PROXY_BATCH_HOSTS 中域名的图片，其他地址返回 { error }
+        前端提交 { urls: [...], inline: true/false }
+        返回 { images: { url: { key, etag, content_type, data(base64, 可选) } 或 { error } } }
+        单张超过 IMAGE_PROXY_INLINE_MAX_BYTES 或累计超过 IMAGE_PROXY_INLINE_TOTAL_BYTES 的图片
+        不返回 data，由前端通过 /api/proxy/image 逐张获取（已在服务端缓存中，可被浏览器长期缓存）
+        """
+        data = request.get_json() or {}
+        urls = data.get("urls") or []
+        if not isinstance(urls, list) or not all(isinstance(url, str) and url for url in urls):
+            return jsonify({"message": "urls必须是图片URL列表"}), 400
+        
+        max_urls = app.config.get("IMAGE_PROXY_BATCH_MAX", 50)
+        if len(urls) > max_urls:
+            return jsonify({"message": f"一次最多请求{max_urls}张图片"}), 400
+        
+        # 批量接口会并发抓取，只允许B站图床，避免被用来批量抓取任意地址、挤掉缓存中的头像
+        allowed_hosts = app.config.get("IMAGE_PROXY_BATCH_HOSTS", ["hdslb.com"])
+        rejected = [url for url in urls if not host_allowed(url, allowed_hosts)]
+        urls = [url for url in urls if url not in rejected]
+        
+        inline = data.get("inline", True) is not False
+        inline_max = app.config.get("IMAGE_PROXY_INLINE_MAX_BYTES", 64 * 1024)
+        inline_budget = app.config.get("IMAGE_PROXY_INLINE_TOTAL_BYTES", 1024 * 1024)
+        
+        images = {url: {"error": "不支持的图片地址"} for url in rejected}
+        for url, image in image_cache.fetch_many(urls).items():
+            if isinstance(image, Exception):
+                print(f"代理图片错误: {str(image)}")
+                images[url] = {"error": "获取图片失败"}
+                continue
+            item = {
+                "key": image.key,
+                "etag": image.etag,
+                "content_type": image.content_type
+            }
+            images[url] = item
+            if not inline or image.size > inline_max or image.size > inline_budget:
+                continue
+            try:
+                with open(image.path, "rb") as f:
+                    content = f.read(inline_max + 1)
+            except OSError as e:
+                print(f"代理图片错误: {str(e)}")
+                continue
+            if len(content) > inline_max or len(content) > inline_budget:
+                continue
+            inline_budget -= len(content)
+            item["data"] = base64.b64encode(content).decode("ascii")
+        
+        response = jsonify({"images": images})
+        response.headers["Access-Control-Allow-Origin"] = "*"
+        return response
+
+
+_app = None
+
+def __getattr__(name):
+    """按需创建模块级的 app 实例（如 `gunicorn app:app`）
+
+    导入本模块时不再创建应用、连接数据库或执行迁移，只有第一次访问 app 时才创建。
+    """
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
     # 从环境变量获取主机和端口
     host = os.getenv('HOST', '0.0.0.0')
     port = int(os.getenv('PORT', 5000))  # 默认使用5000端口
-    app.run(debug=True, host=host, port=port)
+    create_app().run(debug=True, host=host, port=port)
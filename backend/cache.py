@@ -0,0 +1,104 @@
+# cache.py - 歌曲目录缓存
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+
+from database import db
+
+class CatalogCache:
+    """按目录版本号失效的歌曲查询缓存
+
+    缓存的是已经序列化好的JSON字节，键为查询参数（搜索词、页码、每页数量等）。
+    版本号保存在数据库的 catalog_version 表中，由 songs 表上的触发器在同一事务中递增
+    （见数据库迁移7），因此命令行导入或其他进程修改歌曲后，各进程最多 check_interval 秒
+    就会读到新的版本号，旧版本的缓存随即全部作废。本进程的写操作提交后调用 bump() 立即读取。
+    版本号同时用作强ETag，客户端携带 If-None-Match 时可以直接返回304。
+
+    读到的版本号放在共享内存中，多进程部署（fork）时各worker看到的是同一个版本号。
+    """
+
+    def __init__(self, max_entries=512, check_interval=1.0):
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+        self._version = multiprocessing.Value('q', int(time.time() * 1000))
+        self._checked_at = 0
+        self._entries = OrderedDict()
+        self._entries_version = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """从应用配置中读取缓存大小和版本号检查间隔"""
+        self.max_entries = app.config.get('CATALOG_CACHE_SIZE', self.max_entries)
+        self.check_interval = app.config.get('CATALOG_VERSION_CHECK_INTERVAL', self.check_interval)
+        self._checked_at = 0
+        self.clear()
+
+    @property
+    def version(self):
+        """当前目录版本号，距上次读取超过 check_interval 秒时先从数据库重新读取"""
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            self.refresh()
+        return self._version.value
+
+    def refresh(self):
+        """从数据库读取目录版本号，读取失败时继续使用上一次的值"""
+        self._checked_at = time.monotonic()
+        conn = db.get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT version FROM catalog_version WHERE id = 1")
+            row = cur.fetchone()
+        except Exception as e:
+            print(f"读取歌曲目录版本号错误: {str(e)}")
+            return self._version.value
+        finally:
+            conn.close()
+        if row is not None:
+            self._version.value = row[0]
+        return self._version.value
+
+    def etag(self, version=None):
+        """根据版本号生成ETag（不含引号）"""
+        if version is None:
+            version = self.version
+        return f"v{version}"
+
+    def bump(self):
+        """本进程修改了歌曲：版本号已由触发器递增，提交之后调用以立即读取"""
+        return self.refresh()
+
+    def get(self, version, key):
+        """获取指定版本下的缓存内容，未命中返回None"""
+        with self._lock:
+            if self._entries_version != version:
+                return None
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def set(self, version, key, body):
+        """缓存指定版本下的查询结果，超过容量时淘汰最久未使用的条目"""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if version != self.version:
+                # 查询期间目录已经变化，结果可能过期，不再缓存
+                return
+            if self._entries_version != version:
+                self._entries.clear()
+                self._entries_version = version
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """清空缓存内容"""
+        with self._lock:
+            self._entries.clear()
+            self._entries_version = None
+
+# 创建默认缓存实例
+catalog_cache = CatalogCache()
@@ -0,0 +1,134 @@
+# compression.py - API响应的 gzip/brotli 压缩
+import gzip
+import threading
+from collections import OrderedDict
+
+from flask import request
+
+from metrics import metrics
+
+try:
+    import brotli
+except ImportError:  # 未安装brotli时只使用gzip
+    brotli = None
+
+# 值得压缩的响应类型；图片、上传文件等本身已压缩的内容不在其中
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/javascript",
+    "text/html",
+    "text/plain",
+    "text/css",
+    "text/csv",
+    "image/svg+xml",
+}
+
+def encoded_etag(etag, encoding):
+    """压缩后响应的ETag：与未压缩的响应区分开（同 static_assets 的预压缩文件）"""
+    return f"{etag}-{encoding}"
+
+def match_etag(etag):
+    """检查 If-None-Match 是否命中 etag 本身或其任一压缩版本，返回命中的ETag，未命中返回None"""
+    if not etag:
+        return None
+    for candidate in (etag, encoded_etag(etag, "gzip"), encoded_etag(etag, "br")):
+        if request.if_none_match.contains(candidate):
+            return candidate
+    return None
+
+class Compressor:
+    """按 Accept-Encoding 压缩响应体的 after_request 钩子
+
+    - 客户端支持且安装了brotli时优先使用br，否则使用gzip
+    - 小于 min_size 的响应、非文本类型、流式响应和 send_file 返回的文件都不压缩
+    - 带ETag的响应（歌曲目录、舰长快照等本身已缓存的内容）以
+      (编码, 请求路径, ETag) 为键缓存压缩结果，同一份内容只压缩一次；
+      压缩后的响应使用 {ETag}-{编码} 作为ETag，条件请求用 match_etag 判断
+    """
+
+    def __init__(self, min_size=500, level=6, brotli_level=4, cache_size=256):
+        self.min_size = min_size
+        self.level = level
+        self.brotli_level = brotli_level
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """从应用配置中读取压缩参数，并注册 after_request 钩子"""
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', self.min_size)
+        self.level = app.config.get('COMPRESS_LEVEL', self.level)
+        self.brotli_level = app.config.get('COMPRESS_BROTLI_LEVEL', self.brotli_level)
+        self.cache_size = app.config.get('COMPRESS_CACHE_SIZE', self.cache_size)
+        with self._lock:
+            self._cache.clear()
+        metrics.register_gauge("compress.cache_entries", lambda: len(self._cache))
+        app.after_request(self.after_request)
+
+    def choose_encoding(self):
+        """按 Accept-Encoding 选择压缩方式，不支持时返回None"""
+        if brotli is not None and request.accept_encodings["br"] > 0:
+            return "br"
+        if request.accept_encodings["gzip"] > 0:
+            return "gzip"
+        return None
+
+    def compress(self, data, encoding):
+        if encoding == "br":
+            return brotli.compress(data, quality=self.brotli_level)
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+    def _should_compress(self, response):
+        if response.direct_passthrough or response.is_streamed:
+            return False
+        if response.status_code < 200 or response.status_code in (204, 206, 304):
+            return False
+        if "Content-Encoding" in response.headers:
+            return False
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return False
+        return response.content_length is None or response.content_length >= self.min_size
+
+    def after_request(self, response):
+        if not self._should_compress(response):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = self.choose_encoding()
+        if encoding is None:
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        etag, _ = response.get_etag()
+        key = (encoding, request.full_path, etag) if etag and self.cache_size > 0 else None
+        compressed = None
+        if key is not None:
+            with self._lock:
+                compressed = self._cache.get(key)
+                if compressed is not None:
+                    self._cache.move_to_end(key)
+        if compressed is None:
+            compressed = self.compress(data, encoding)
+            metrics.incr("compress.compressed")
+            if key is not None:
+                with self._lock:
+                    self._cache[key] = compressed
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+        else:
+            metrics.incr("compress.cache_hits")
+
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+        response.headers["Content-Encoding"] = encoding
+        if etag:
+            # 强校验器必须按编码区分，否则压缩和未压缩的内容共用同一个ETag
+            _, weak = response.get_etag()
+            response.set_etag(encoded_etag(etag, encoding), weak=weak)
+        return response
+
+# 创建默认压缩实例
+compressor = Compressor()
@@ -9,14 +9,129 @@ class Config:
     """应用配置类"""
     SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
     UPLOAD_FOLDER = 'uploads'  # 文件上传目录
+    MAX_CONTENT_LENGTH = int(os.getenv("MAX_CONTENT_LENGTH", str(16 * 1024 * 1024)))  # 请求体大小上限
+    
+    # 上传图片缩略图配置
+    UPLOAD_VARIANT_WIDTHS = tuple(int(w) for w in os.getenv("UPLOAD_VARIANT_WIDTHS", "64,128,256,512,1024").split(","))
+    UPLOAD_VARIANT_WORKERS = int(os.getenv("UPLOAD_VARIANT_WORKERS", "2"))  # 生成缩略图的线程数
+    UPLOAD_VARIANT_TIMEOUT = float(os.getenv("UPLOAD_VARIANT_TIMEOUT", "10"))  # 等待生成的秒数
+    
+    # 前端静态文件配置
+    STATIC_BUILD_DIR = os.getenv("STATIC_BUILD_DIR", 'build')  # 前端构建产物目录
+    STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", "3600"))  # 文件名不带哈希的文件（如模型）的缓存秒数
+    STATIC_IMMUTABLE_MAX_AGE = int(os.getenv("STATIC_IMMUTABLE_MAX_AGE", str(365 * 24 * 3600)))  # 带哈希的文件
+    
+    # 棉花糖延迟写入配置：开启后提交先进入内存队列，由后台线程批量写入
+    COTTON_CANDY_WRITE_BEHIND = os.getenv("COTTON_CANDY_WRITE_BEHIND", "false").lower() == "true"
+    COTTON_CANDY_QUEUE_SIZE = int(os.getenv("COTTON_CANDY_QUEUE_SIZE", "1000"))  # 队列满时返回429
+    COTTON_CANDY_BATCH_SIZE = int(os.getenv("COTTON_CANDY_BATCH_SIZE", "100"))  # 每批最多写入条数
+    COTTON_CANDY_FLUSH_INTERVAL = float(os.getenv("COTTON_CANDY_FLUSH_INTERVAL", "0.2"))  # 最长等待秒数
+    
+    # 棉花糖事件推送（SSE）配置
+    NOTIFY_POLL_INTERVAL = float(os.getenv("NOTIFY_POLL_INTERVAL", "1"))  # 读取事件日志的间隔秒数
+    NOTIFY_HEARTBEAT = float(os.getenv("NOTIFY_HEARTBEAT", "15"))  # 心跳间隔秒数
+    NOTIFY_EVENT_RETAIN = int(os.getenv("NOTIFY_EVENT_RETAIN", "10000"))  # 事件日志保留条数
+    NOTIFY_PRUNE_INTERVAL = float(os.getenv("NOTIFY_PRUNE_INTERVAL", "60"))  # 清理事件日志的最小间隔秒数
+    NOTIFY_MAX_SUBSCRIBERS = int(os.getenv("NOTIFY_MAX_SUBSCRIBERS", "4"))  # 每个进程的推送连接数上限，每个连接占用一个工作线程
+    
+    # 公开写接口的准入控制：每个客户端的令牌桶（每秒补充数, 最多积攒数）和全局并发上限
+    ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+    ADMISSION_MAX_CLIENTS = int(os.getenv("ADMISSION_MAX_CLIENTS", "10000"))  # 每个接口最多保存的令牌桶数
+    ADMISSION_IDLE_TTL = float(os.getenv("ADMISSION_IDLE_TTL", "600"))  # 令牌桶空闲多少秒后淘汰
+    ADMISSION_TRUST_FORWARDED = os.getenv("ADMISSION_TRUST_FORWARDED", "false").lower() == "true"  # 反向代理之后设为true
+    ADMISSION_RULES = {
+        # 接口: (每秒补充令牌数, 令牌桶容量, 并发上限)
+        "cotton_candy": (
+            float(os.getenv("ADMISSION_COTTON_CANDY_RATE", "0.2")),
+            int(os.getenv("ADMISSION_COTTON_CANDY_BURST", "5")),
+            int(os.getenv("ADMISSION_COTTON_CANDY_CONCURRENCY", "8"))
+        ),
+        "register": (
+            float(os.getenv("ADMISSION_REGISTER_RATE", "0.02")),
+            int(os.getenv("ADMISSION_REGISTER_BURST", "3")),
+            int(os.getenv("ADMISSION_REGISTER_CONCURRENCY", "2"))
+        ),
+        "upload": (
+            float(os.getenv("ADMISSION_UPLOAD_RATE", "0.1")),
+            int(os.getenv("ADMISSION_UPLOAD_BURST", "5")),
+            int(os.getenv("ADMISSION_UPLOAD_CONCURRENCY", "2"))
+        ),
+    }
+    
+    # 歌曲批量导入配置
+    SONG_IMPORT_CHUNK_SIZE = int(os.getenv("SONG_IMPORT_CHUNK_SIZE", "1000"))  # 每个事务写入的条数
+    SONG_IMPORT_MAX_ERRORS = int(os.getenv("SONG_IMPORT_MAX_ERRORS", "1000"))  # 错误报告最多保留的行数
+    
+    # 数据导出配置
+    EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))  # 每次从数据库读取的行数
+    EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", "6"))  # compress=gzip 时的压缩级别
+    
+    # 响应压缩配置
+    COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "500"))  # 小于该字节数的响应不压缩
+    COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))  # gzip压缩级别 1-9
+    COMPRESS_BROTLI_LEVEL = int(os.getenv("COMPRESS_BROTLI_LEVEL", "4"))  # brotli压缩级别 0-11
+    COMPRESS_CACHE_SIZE = int(os.getenv("COMPRESS_CACHE_SIZE", "256"))  # 缓存的压缩结果条数
+    
+    # 服务端抽奖配置
+    PRIZE_DRAW_MAX = int(os.getenv("PRIZE_DRAW_MAX", "100000"))  # 单次请求最多抽取次数
+    PRIZE_DRAW_VECTORIZE_THRESHOLD = int(os.getenv("PRIZE_DRAW_VECTORIZE_THRESHOLD", "1000"))  # 超过该次数使用NumPy
     DB_PATH = os.getenv("DB_PATH", 'songs.db')
     
+    # SQLite连接池配置
+    SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+    SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))  # 毫秒
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-16000"))  # 负数表示KB
+    
+    # 歌曲目录缓存条目数，0表示不缓存
+    CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "512"))
+    CATALOG_VERSION_CHECK_INTERVAL = float(os.getenv("CATALOG_VERSION_CHECK_INTERVAL", "1"))  # 秒，读取歌曲目录版本号的间隔
+    
     # PostgreSQL数据库配置
     POSTGRES_HOST = os.getenv("POSTGRES_HOST")
     POSTGRES_PORT = int(os.getenv("POSTGRES_PORT", "5432"))
     POSTGRES_DB = os.getenv("POSTGRES_DB")
     POSTGRES_USER = os.getenv("POSTGRES_USER")
     POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
+    
+    # PostgreSQL连接池配置
+    POSTGRES_POOL_MIN = int(os.getenv("POSTGRES_POOL_MIN", "1"))
+    POSTGRES_POOL_MAX = int(os.getenv("POSTGRES_POOL_MAX", "10"))
+    POSTGRES_POOL_TIMEOUT = float(os.getenv("POSTGRES_POOL_TIMEOUT", "5"))  # 等待空闲连接的秒数
+    POSTGRES_STATEMENT_TIMEOUT = int(os.getenv("POSTGRES_STATEMENT_TIMEOUT", "5000"))  # 毫秒
+    POSTGRES_HEALTHCHECK_INTERVAL = float(os.getenv("POSTGRES_HEALTHCHECK_INTERVAL", "30"))  # 秒
+    
+    # 舰长信息快照配置
+    GUARDS_ROOM_ID = int(os.getenv("GUARDS_ROOM_ID", "1749141031"))
+    GUARDS_REFRESH_INTERVAL = float(os.getenv("GUARDS_REFRESH_INTERVAL", "60"))  # 秒
+    
+    # 图片代理磁盘缓存配置
+    IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", 'cache/images')
+    IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+    IMAGE_CACHE_TTL = int(os.getenv("IMAGE_CACHE_TTL", "86400"))  # 超过该秒数后向上游重新验证
+    
+    # 图片代理上游请求配置
+    IMAGE_PROXY_MAX_BYTES = int(os.getenv("IMAGE_PROXY_MAX_BYTES", str(10 * 1024 * 1024)))
+    IMAGE_PROXY_CONNECT_TIMEOUT = float(os.getenv("IMAGE_PROXY_CONNECT_TIMEOUT", "3"))
+    IMAGE_PROXY_READ_TIMEOUT = float(os.getenv("IMAGE_PROXY_READ_TIMEOUT", "10"))
+    IMAGE_PROXY_POOL_HOSTS = int(os.getenv("IMAGE_PROXY_POOL_HOSTS", "10"))  # 缓存连接池的域名数
+    IMAGE_PROXY_POOL_SIZE = int(os.getenv("IMAGE_PROXY_POOL_SIZE", "20"))  # 每个域名的连接数
+    IMAGE_PROXY_BATCH_WORKERS = int(os.getenv("IMAGE_PROXY_BATCH_WORKERS", "8"))  # 批量抓取的并发数
+    IMAGE_PROXY_BATCH_MAX = int(os.getenv("IMAGE_PROXY_BATCH_MAX", "50"))  # 批量接口单次最多的图片数
+    # 批量接口只代理这些域名（及其子域名）下的图片，默认只允许B站图床
+    IMAGE_PROXY_BATCH_HOSTS = [h.strip().lower() for h in os.getenv("IMAGE_PROXY_BATCH_HOSTS", "hdslb.com").split(",") if h.strip()]
+    IMAGE_PROXY_INLINE_MAX_BYTES = int(os.getenv("IMAGE_PROXY_INLINE_MAX_BYTES", str(64 * 1024)))  # 批量接口内联返回的单张图片上限
+    IMAGE_PROXY_INLINE_TOTAL_BYTES = int(os.getenv("IMAGE_PROXY_INLINE_TOTAL_BYTES", str(1024 * 1024)))  # 批量接口单次内联的总字节数上限
+
+    # 生产服务器（gunicorn）配置，用于 python main.py --serve
+    WEB_WORKERS = int(os.getenv("WEB_WORKERS", "2"))  # 工作进程数
+    WEB_THREADS = int(os.getenv("WEB_THREADS", "8"))  # 每个进程的线程数
+    WEB_KEEPALIVE = int(os.getenv("WEB_KEEPALIVE", "5"))  # 长连接保持秒数
+    WEB_TIMEOUT = int(os.getenv("WEB_TIMEOUT", "60"))  # 请求处理超时秒数
+    WEB_GRACEFUL_TIMEOUT = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))  # 优雅退出等待秒数
+    WEB_MAX_REQUESTS = int(os.getenv("WEB_MAX_REQUESTS", "0"))  # 处理多少请求后重启进程，0表示不重启
+    WEB_LIMIT_REQUEST_LINE = int(os.getenv("WEB_LIMIT_REQUEST_LINE", "4094"))
+    WEB_LIMIT_REQUEST_FIELD_SIZE = int(os.getenv("WEB_LIMIT_REQUEST_FIELD_SIZE", "8190"))
 
 class ProductionConfig(Config):
     """生产环境配置"""
@@ -1,42 +1,307 @@
 # database.py
+import atexit
 import sqlite3
 import os
 import json
+import queue
+import threading
+from flask import g, has_app_context
 
-class Database:
-    def __init__(self, db_path="songs.db"):
-        """初始化数据库类，设置数据库路径"""
+class PooledConnection(sqlite3.Connection):
+    """连接池中的SQLite连接
+
+    调用 close() 时不会真正关闭连接，而是归还给所属的连接池；
+    请求作用域内的连接由 teardown 统一归还，close() 为空操作。
+    """
+    pool = None
+    request_scoped = False
+
+    def close(self):
+        if self.request_scoped:
+            return
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+    def really_close(self):
+        """真正关闭底层连接"""
+        super().close()
+
+class ConnectionPool:
+    """线程安全的SQLite连接池
+
+    连接按需创建，最多缓存 size 个空闲连接；每个连接在创建时设置一次
+    WAL 日志模式、synchronous、busy_timeout、mmap 和缓存大小等 PRAGMA。
+    """
+
+    def __init__(self, db_path, size=8, busy_timeout=5000, mmap_size=268435456, cache_size=-16000):
         self.db_path = db_path
-    
-    def get_connection(self):
-        """获取数据库连接"""
-        conn = sqlite3.connect(self.db_path)
+        self.size = size
+        self.busy_timeout = busy_timeout
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._opened = False  # 是否建立过连接，关闭时据此决定是否需要检查点
+
+    def _connect(self):
+        """创建新连接并设置 PRAGMA"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout / 1000,
+            check_same_thread=False,
+            factory=PooledConnection
+        )
         conn.row_factory = sqlite3.Row  # 方便后续以字典形式获取数据
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout)}")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size={int(self.cache_size)}")
+        conn.pool = self
+        self._opened = True
         return conn
+
+    def acquire(self):
+        """从池中取出一个连接，没有空闲连接时新建"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        conn.request_scoped = False
+        return conn
+
+    def release(self, conn):
+        """归还连接，未提交的事务会被回滚"""
+        conn.request_scoped = False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.really_close()
+            return
+        with self._lock:
+            if self._closed:
+                conn.really_close()
+                return
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.really_close()
+
+    def checkpoint(self, conn):
+        """把WAL中的内容写回数据库文件并清空WAL
+
+        WAL和共享内存文件（-wal/-shm）与数据库文件放在同一目录，
+        关闭前做一次检查点，避免只持久化了数据库文件时丢失未写回的提交。
+        """
+        try:
+            busy, _, _ = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+            if busy:
+                print("数据库检查点未完成：仍有其他连接在读写")
+        except sqlite3.Error as e:
+            print(f"数据库检查点错误: {str(e)}")
+
+    def close_all(self):
+        """执行检查点并关闭所有空闲连接，之后归还的连接也会被直接关闭"""
+        with self._lock:
+            self._closed = True
+            idle = []
+            while True:
+                try:
+                    idle.append(self._idle.get_nowait())
+                except queue.Empty:
+                    break
+        if self._opened:
+            conn = idle[0] if idle else self._connect()
+            if not idle:
+                idle.append(conn)
+            self.checkpoint(conn)
+        for conn in idle:
+            conn.really_close()
+
+class Database:
+    def __init__(self, db_path="songs.db", pool_size=8, busy_timeout=5000, mmap_size=268435456, cache_size=-16000):
+        """初始化数据库类，设置数据库路径和连接池参数"""
+        self._db_path = db_path
+        self.pool_size = pool_size
+        self.busy_timeout = busy_timeout
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        self._fts_enabled = None  # 是否已建立歌曲全文索引，首次使用时查询
+        self._atexit_registered = False
+
+    @property
+    def db_path(self):
+        return self._db_path
+
+    @db_path.setter
+    def db_path(self, value):
+        """修改数据库路径时丢弃旧的连接池"""
+        if value != self._db_path:
+            self._db_path = value
+            self.reset_pool()
+
+    @property
+    def pool(self):
+        """懒加载的连接池
+
+        SQLite连接不能跨 fork 使用，子进程第一次访问时会丢弃从父进程继承的
+        连接池（不关闭其中的连接，避免影响父进程），重新创建自己的连接池。
+        """
+        if self._pool is None or self._pool_pid != os.getpid():
+            with self._pool_lock:
+                if self._pool is None or self._pool_pid != os.getpid():
+                    self._pool_pid = os.getpid()
+                    self._pool = ConnectionPool(
+                        self._db_path,
+                        size=self.pool_size,
+                        busy_timeout=self.busy_timeout,
+                        mmap_size=self.mmap_size,
+                        cache_size=self.cache_size
+                    )
+        return self._pool
+
+    def reset_pool(self):
+        """关闭并丢弃当前连接池"""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+            inherited = self._pool_pid != os.getpid()
+        if pool is not None and not inherited:
+            pool.close_all()
+
+    def init_app(self, app):
+        """从应用配置中读取数据库参数，并注册请求结束时归还连接的钩子"""
+        self.pool_size = app.config.get('SQLITE_POOL_SIZE', self.pool_size)
+        self.busy_timeout = app.config.get('SQLITE_BUSY_TIMEOUT', self.busy_timeout)
+        self.mmap_size = app.config.get('SQLITE_MMAP_SIZE', self.mmap_size)
+        self.cache_size = app.config.get('SQLITE_CACHE_SIZE', self.cache_size)
+        self.reset_pool()
+        self.db_path = app.config.get('DB_PATH', 'songs.db')
+        app.teardown_appcontext(self.teardown)
+        if not self._atexit_registered:
+            # 进程退出时执行检查点并关闭连接（gunicorn 工作进程另见 worker_exit）
+            atexit.register(self.reset_pool)
+            self._atexit_registered = True
+
+    def teardown(self, exception=None):
+        """请求结束时归还请求作用域内的连接"""
+        conn = g.pop('_db_conn', None)
+        if conn is not None:
+            conn.pool.release(conn)
+
+    def get_connection(self):
+        """获取数据库连接
+
+        在应用上下文中返回请求作用域内共享的连接（首次调用时才从池中取出，
+        请求结束时归还）；否则直接从池中取出一个连接，close() 时归还。
+        """
+        if has_app_context():
+            conn = g.get('_db_conn')
+            if conn is None:
+                conn = self.pool.acquire()
+                conn.request_scoped = True
+                g._db_conn = conn
+            return conn
+        return self.pool.acquire()
     
     def init_db(self, reset=False):
-        """初始化数据库：创建必要的表并插入示例数据
+        """初始化数据库：执行尚未应用的迁移（建表、索引、初始数据）
         
         Args:
             reset: 如果为True，则删除现有数据库并重新创建
         """
-        if reset and os.path.exists(self.db_path):
-            os.remove(self.db_path)
+        if reset:
+            self.reset_pool()
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(self.db_path + suffix):
+                    os.remove(self.db_path + suffix)
         
-        # 创建所有表
-        self.create_users_table()
-        self.create_songs_table()
-        self.create_prizes_table()
-        self.create_cotton_candy_table()
+        self.migrate()
+    
+    def migrations(self):
+        """数据库迁移列表：(版本号, 说明, 执行函数)
         
-        # 插入初始数据
-        self.seed_users_data()
-        self.seed_songs_data()
+        每个执行函数接收同一个游标，在迁移事务中执行；新的表结构和索引
+        只能以新版本号追加到末尾，已发布的迁移不要修改。
+        """
+        return [
+            (1, "创建基础表并插入初始数据", self.migrate_initial_schema),
+            (2, "歌曲全文索引", self.create_songs_fts),
+            (3, "奖品按用户查询的索引", self.create_prizes_user_index),
+            (4, "棉花糖列表和未读统计的索引", self.create_cotton_candy_indexes),
+            (5, "棉花糖未读计数和事件日志", self.create_cotton_candy_events),
+            (6, "按标题和艺术家查找歌曲的索引", self.create_songs_title_artist_index),
+            (7, "歌曲目录版本号", self.create_catalog_version),
+        ]
     
-    def create_users_table(self):
-        """创建用户表"""
+    @property
+    def latest_version(self):
+        return self.migrations()[-1][0]
+    
+    def schema_version(self, cur):
+        """当前数据库的表结构版本，尚未建立版本表时为0"""
+        try:
+            cur.execute("SELECT MAX(version) FROM schema_migrations")
+        except sqlite3.OperationalError:
+            return 0
+        return cur.fetchone()[0] or 0
+    
+    def migrate(self):
+        """执行尚未应用的迁移，表结构已是最新时只做一次版本查询
+        
+        所有迁移在同一个写事务中执行，多个进程同时启动时只有一个会真正迁移。
+        """
         conn = self.get_connection()
         cur = conn.cursor()
+        if self.schema_version(cur) >= self.latest_version:
+            conn.close()
+            return
+        
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            # 获得写锁后重新检查，其他进程可能已经完成迁移
+            current = self.schema_version(cur)
+            for version, description, migration in self.migrations():
+                if version <= current:
+                    continue
+                print(f"执行数据库迁移 {version}: {description}")
+                migration(cur)
+                cur.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (?, ?)",
+                    (version, description)
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        self._fts_enabled = None
+    
+    def migrate_initial_schema(self, cur):
+        """迁移1：基础表和初始数据（兼容已经存在这些表的旧数据库）"""
+        self.create_users_table(cur)
+        self.create_songs_table(cur)
+        self.create_prizes_table(cur)
+        self.create_cotton_candy_table(cur)
+        self.seed_users_data(cur)
+        self.seed_songs_data(cur)
+    
+    def create_users_table(self, cur):
+        """创建用户表"""
         cur.execute("""
             CREATE TABLE IF NOT EXISTS users (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -46,13 +311,9 @@ class Database:
                 is_admin INTEGER DEFAULT 0
             )
         """)
-        conn.commit()
-        conn.close()
     
-    def create_songs_table(self):
+    def create_songs_table(self, cur):
         """创建歌曲表"""
-        conn = self.get_connection()
-        cur = conn.cursor()
         cur.execute("""
         CREATE TABLE IF NOT EXISTS songs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -65,13 +326,99 @@ class Database:
             tags TEXT
         )
         """)
-        conn.commit()
-        conn.close()
     
-    def create_prizes_table(self):
+    @property
+    def fts_enabled(self):
+        """歌曲全文索引是否可用（每个进程只查询一次）"""
+        if self._fts_enabled is None:
+            conn = self.get_connection()
+            cur = conn.cursor()
+            cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'songs_fts'")
+            self._fts_enabled = cur.fetchone() is not None
+            conn.close()
+        return self._fts_enabled
+    
+    @fts_enabled.setter
+    def fts_enabled(self, value):
+        self._fts_enabled = value
+    
+    def create_songs_fts(self, cur):
+        """创建歌曲全文索引（FTS5）及同步触发器
+
+        使用 trigram 分词器，中文标题也能按子串匹配（查询词至少3个字符）。
+        如果SQLite未编译FTS5或不支持trigram，则跳过，搜索会退回到 LIKE 查询。
+        """
+        cur.execute("SAVEPOINT songs_fts")
+        try:
+            cur.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS songs_fts USING fts5(
+                    title, artist, album, tags,
+                    content='songs', content_rowid='id',
+                    tokenize='trigram'
+                )
+            """)
+        except sqlite3.OperationalError as e:
+            print(f"全文索引不可用，搜索将使用LIKE: {str(e)}")
+            cur.execute("ROLLBACK TO songs_fts")
+            cur.execute("RELEASE songs_fts")
+            return
+        
+        # 通过触发器保持索引与歌曲表同步
+        cur.execute("""
+            CREATE TRIGGER IF NOT EXISTS songs_fts_ai AFTER INSERT ON songs BEGIN
+                INSERT INTO songs_fts(rowid, title, artist, album, tags)
+                VALUES (new.id, new.title, new.artist, new.album, new.tags);
+            END
+        """)
+        cur.execute("""
+            CREATE TRIGGER IF NOT EXISTS songs_fts_ad AFTER DELETE ON songs BEGIN
+                INSERT INTO songs_fts(songs_fts, rowid, title, artist, album, tags)
+                VALUES ('delete', old.id, old.title, old.artist, old.album, old.tags);
+            END
+        """)
+        cur.execute("""
+            CREATE TRIGGER IF NOT EXISTS songs_fts_au AFTER UPDATE ON songs BEGIN
+                INSERT INTO songs_fts(songs_fts, rowid, title, artist, album, tags)
+                VALUES ('delete', old.id, old.title, old.artist, old.album, old.tags);
+                INSERT INTO songs_fts(rowid, title, artist, album, tags)
+                VALUES (new.id, new.title, new.artist, new.album, new.tags);
+            END
+        """)
+        
+        # 为已有歌曲建立索引
+        cur.execute("INSERT INTO songs_fts(songs_fts) VALUES ('rebuild')")
+        cur.execute("RELEASE songs_fts")
+    
+    def create_songs_title_artist_index(self, cur):
+        """批量导入按 (标题, 艺术家) 查找已有歌曲时使用的索引"""
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_songs_title_artist ON songs(title, artist)")
+    
+    def create_catalog_version(self, cur):
+        """歌曲目录版本号
+        
+        由触发器在修改歌曲的同一事务中递增，不论是接口、命令行导入还是其他进程的写入，
+        各工作进程的目录缓存只需读取这一行就能知道目录是否变化。
+        初始值取当前毫秒时间戳，不会与之前按时间戳生成的ETag冲突。
+        """
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS catalog_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL
+            )
+        """)
+        cur.execute("""
+            INSERT OR IGNORE INTO catalog_version (id, version)
+            VALUES (1, CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER))
+        """)
+        for event, name in (("INSERT", "ai"), ("UPDATE", "au"), ("DELETE", "ad")):
+            cur.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS songs_catalog_{name} AFTER {event} ON songs BEGIN
+                    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+                END
+            """)
+    
+    def create_prizes_table(self, cur):
         """创建奖品表"""
-        conn = self.get_connection()
-        cur = conn.cursor()
         cur.execute("""
             CREATE TABLE IF NOT EXISTS prizes (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -81,13 +428,13 @@ class Database:
                 image TEXT
             )
         """)
-        conn.commit()
-        conn.close()
     
-    def create_cotton_candy_table(self):
+    def create_prizes_user_index(self, cur):
+        """按用户查询奖品的索引"""
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_prizes_user_id ON prizes(user_id)")
+    
+    def create_cotton_candy_table(self, cur):
         """创建棉花糖表"""
-        conn = self.get_connection()
-        cur = conn.cursor()
         cur.execute("""
             CREATE TABLE IF NOT EXISTS cotton_candy (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -98,14 +445,73 @@ class Database:
                 read INTEGER DEFAULT 0
             )
         """)
-        conn.commit()
-        conn.close()
     
-    def seed_users_data(self):
-        """插入默认用户数据"""
-        conn = self.get_connection()
-        cur = conn.cursor()
+    def create_cotton_candy_indexes(self, cur):
+        """棉花糖列表（按 create_time DESC, id DESC 排序，可按 read 过滤）的索引
+        
+        - idx_cotton_candy_time：不过滤时按索引顺序读取，游标条件 (create_time, id) < (?, ?) 直接定位
+        - idx_cotton_candy_read_time：按 read 过滤时免排序，未读数量 COUNT(*) WHERE read = 0 只扫描索引
+        """
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_cotton_candy_time
+            ON cotton_candy(create_time DESC, id DESC)
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_cotton_candy_read_time
+            ON cotton_candy(read, create_time DESC, id DESC)
+        """)
+    
+    def create_cotton_candy_events(self, cur):
+        """棉花糖未读计数和事件日志
         
+        由触发器在同一事务中维护：cotton_candy_stats 保存未读数量，读取时不用再扫描表；
+        cotton_candy_events 记录新增/已读/删除事件及发生后的未读数量，
+        多个工作进程通过读取该表把变化推送给各自连接的管理员。
+        """
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS cotton_candy_stats (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                unread INTEGER NOT NULL
+            )
+        """)
+        cur.execute("""
+            INSERT OR REPLACE INTO cotton_candy_stats (id, unread)
+            VALUES (1, (SELECT COUNT(*) FROM cotton_candy WHERE read = 0))
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS cotton_candy_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                type TEXT NOT NULL,
+                candy_id INTEGER NOT NULL,
+                unread INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cur.execute("""
+            CREATE TRIGGER IF NOT EXISTS cotton_candy_events_ai AFTER INSERT ON cotton_candy BEGIN
+                UPDATE cotton_candy_stats SET unread = unread + (new.read = 0) WHERE id = 1;
+                INSERT INTO cotton_candy_events (type, candy_id, unread)
+                VALUES ('new', new.id, (SELECT unread FROM cotton_candy_stats WHERE id = 1));
+            END
+        """)
+        cur.execute("""
+            CREATE TRIGGER IF NOT EXISTS cotton_candy_events_au AFTER UPDATE OF read ON cotton_candy
+            WHEN old.read IS NOT new.read BEGIN
+                UPDATE cotton_candy_stats SET unread = unread + (new.read = 0) - (old.read = 0) WHERE id = 1;
+                INSERT INTO cotton_candy_events (type, candy_id, unread)
+                VALUES ('read', new.id, (SELECT unread FROM cotton_candy_stats WHERE id = 1));
+            END
+        """)
+        cur.execute("""
+            CREATE TRIGGER IF NOT EXISTS cotton_candy_events_ad AFTER DELETE ON cotton_candy BEGIN
+                UPDATE cotton_candy_stats SET unread = unread - (old.read = 0) WHERE id = 1;
+                INSERT INTO cotton_candy_events (type, candy_id, unread)
+                VALUES ('delete', old.id, (SELECT unread FROM cotton_candy_stats WHERE id = 1));
+            END
+        """)
+    
+    def seed_users_data(self, cur):
+        """插入默认用户数据"""
         # 检查是否已存在管理员用户
         cur.execute("SELECT id FROM users WHERE username = ?", ("tofu",))
         if not cur.fetchone():
@@ -118,15 +524,9 @@ class Database:
                 INSERT INTO users (username, password, bilibili_uid, is_admin)
                 VALUES (?, ?, ?, ?)
             """, admin_users)
-            conn.commit()
-        
-        conn.close()
     
-    def seed_songs_data(self):
+    def seed_songs_data(self, cur):
         """插入示例歌曲数据"""
-        conn = self.get_connection()
-        cur = conn.cursor()
-        
         # 检查是否已存在歌曲数据
         cur.execute("SELECT COUNT(*) FROM songs")
         count = cur.fetchone()[0]
@@ -150,9 +550,6 @@ class Database:
             INSERT INTO songs (title, artist, album, genre, year, meta_data, tags)
             VALUES (?, ?, ?, ?, ?, ?, ?)
             """, example_songs)
-            conn.commit()
-        
-        conn.close()
 
 # 创建默认数据库实例
 db = Database()
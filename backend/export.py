@@ -0,0 +1,72 @@
+# export.py - 以 NDJSON / CSV 流式导出数据表
+import csv
+import io
+import zlib
+
+from database import db
+
+FORMATS = {
+    "ndjson": ("application/x-ndjson", ".ndjson"),
+    "csv": ("text/csv", ".csv"),
+}
+
+def export_rows(query, params, fields, fmt, dumps, converters=None, batch_size=500, chunk_bytes=64 * 1024):
+    """执行查询并逐批产生导出内容（字节块）
+
+    在生成器内部单独从连接池取出连接（响应开始发送后请求上下文已经结束，
+    不能使用请求作用域的连接），整个导出在同一个读快照中完成；
+    每次只取 batch_size 行，攒够 chunk_bytes 字节输出一次，内存占用与表大小无关。
+
+    Args:
+        fields: 查询选取的列名，也是CSV表头和NDJSON的键
+        dumps: 把字典序列化为字节的函数
+        converters: 列名 -> 转换函数，仅用于NDJSON
+    """
+    conn = db.pool.acquire()
+    cur = conn.cursor()
+    try:
+        cur.execute(query, params)
+        buffer = io.StringIO() if fmt == "csv" else bytearray()
+        writer = None
+        if fmt == "csv":
+            writer = csv.writer(buffer)
+            writer.writerow(fields)
+
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            if fmt == "csv":
+                writer.writerows(rows)
+                if buffer.tell() >= chunk_bytes:
+                    yield buffer.getvalue().encode("utf-8")
+                    buffer.seek(0)
+                    buffer.truncate()
+            else:
+                for row in rows:
+                    item = dict(zip(fields, row))
+                    if converters:
+                        for name, convert in converters.items():
+                            item[name] = convert(item[name])
+                    buffer += dumps(item)
+                    buffer += b"\n"
+                if len(buffer) >= chunk_bytes:
+                    yield bytes(buffer)
+                    buffer.clear()
+
+        rest = buffer.getvalue().encode("utf-8") if fmt == "csv" else bytes(buffer)
+        if rest:
+            yield rest
+    finally:
+        # 客户端中途断开时也要结束语句，释放读快照后再归还连接
+        cur.close()
+        conn.close()
+
+def gzip_stream(chunks, level=6):
+    """边生成边gzip压缩，每个输入块压缩后立即输出"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip 格式
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,118 @@
+# guards.py - 舰长信息查询与快照缓存
+import hashlib
+import json
+import os
+import threading
+import time
+
+from postgres import pg_pool
+from serialization import GUARD_FIELDS, columns, rows_to_dicts
+from singleflight import SingleFlight
+
+def fetch_guards(room_id):
+    """从PostgreSQL查询特定直播间的舰长信息，返回格式化后的列表"""
+    # 从连接池借出连接，按列名一次性转换为字典
+    with pg_pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT {columns(GUARD_FIELDS)}
+                FROM bilibili_guards
+                WHERE room_id = %s
+                ORDER BY rank ASC
+            """, (room_id,))
+
+            return rows_to_dicts(cur, cur.fetchall(), {
+                "timestamp": lambda value: value.isoformat() if value else None
+            })
+
+class GuardsSnapshot:
+    """舰长信息快照缓存
+
+    保存序列化好的 /api/guards 响应字节，由后台线程按 interval 秒定期刷新。
+    读取时直接返回当前快照（stale-while-revalidate）：快照过期时触发一次
+    异步刷新，但请求本身不等待PostgreSQL；数据库不可用时继续返回最后一次
+    成功的快照。只有在还没有任何快照时，第一次请求才会同步查询。
+    并发的刷新（冷启动时的大量请求、后台线程与过期触发的刷新）通过单飞合并，
+    同一时间对同一直播间只会有一个查询落到PostgreSQL。
+    """
+
+    def __init__(self, room_id=1749141031, interval=60):
+        self.room_id = room_id
+        self.interval = interval
+        self.dumps = json.dumps
+        self._body = None
+        self._etag = None
+        self._updated_at = 0
+        self._lock = threading.Lock()
+        self._flight = SingleFlight("guards")
+        self._pid = None
+
+    def init_app(self, app):
+        """从应用配置中读取直播间和刷新间隔，使用应用的JSON序列化方式"""
+        self.room_id = app.config.get('GUARDS_ROOM_ID', self.room_id)
+        self.interval = app.config.get('GUARDS_REFRESH_INTERVAL', self.interval)
+        self.dumps = app.json.dumps
+        with self._lock:
+            self._body = None
+            self._etag = None
+            self._updated_at = 0
+
+    @property
+    def age(self):
+        """快照距上次成功刷新的秒数"""
+        return time.monotonic() - self._updated_at
+
+    def _load(self):
+        """查询数据库并替换快照"""
+        guards = fetch_guards(self.room_id)
+        body = self.dumps({
+            "message": "获取舰长信息成功",
+            "total": len(guards),
+            "guards": guards
+        }).encode("utf-8")
+        etag = hashlib.sha1(body).hexdigest()
+        with self._lock:
+            self._body, self._etag = body, etag
+            self._updated_at = time.monotonic()
+        return body, etag
+
+    def refresh(self):
+        """刷新快照，失败时保留旧快照并抛出异常；并发调用共享同一次查询"""
+        return self._flight.do(("guards", self.room_id), self._load)
+
+    def _refresh_quietly(self):
+        """后台刷新，错误只记录日志"""
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"刷新舰长信息快照失败: {str(e)}")
+
+    def _refresh_loop(self):
+        """后台线程：按间隔定期刷新快照"""
+        while True:
+            time.sleep(self.interval)
+            self._refresh_quietly()
+
+    def _ensure_started(self):
+        """按进程启动后台刷新线程（fork 后的子进程需要重新启动）"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._refresh_loop, name="guards-refresher", daemon=True).start()
+
+    def get(self):
+        """返回当前快照 (字节, ETag)，没有快照时同步查询一次"""
+        self._ensure_started()
+        with self._lock:
+            body, etag = self._body, self._etag
+        if body is None:
+            return self.refresh()
+        if self.age > self.interval and not self._flight.in_flight(("guards", self.room_id)):
+            threading.Thread(target=self._refresh_quietly, daemon=True).start()
+        return body, etag
+
+# 创建默认快照实例
+guards_snapshot = GuardsSnapshot()
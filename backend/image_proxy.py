@@ -0,0 +1,345 @@
+# image_proxy.py - 图片代理及本地磁盘缓存
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from singleflight import SingleFlight
+
+# 请求上游图片时使用的请求头，模拟浏览器请求以绕过防盗链
+PROXY_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Referer': 'https://www.bilibili.com'
+}
+
+class ImageTooLarge(Exception):
+    """上游图片超过大小限制"""
+
+def normalize_url(url):
+    """规范化图片URL：补全协议、协议和域名小写、去掉片段"""
+    url = url.strip()
+    if url.startswith("//"):
+        url = "https:" + url
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", parts.query, ""))
+
+def host_allowed(url, domains):
+    """URL 是否为 http(s) 且域名是 domains 中的某个域名或其子域名"""
+    parts = urlsplit(normalize_url(url))
+    host = parts.hostname or ""
+    if parts.scheme not in ("http", "https") or not host:
+        return False
+    return any(host == domain or host.endswith("." + domain) for domain in domains)
+
+def cache_key(url):
+    """由规范化后的URL计算缓存键"""
+    return hashlib.sha256(normalize_url(url).encode("utf-8")).hexdigest()
+
+class CachedImage:
+    """磁盘缓存中的一张图片"""
+
+    def __init__(self, key, path, meta):
+        self.key = key
+        self.path = path
+        self.content_type = meta.get("content_type") or "application/octet-stream"
+        self.etag = meta.get("etag")  # 本地内容的ETag（内容哈希）
+        self.size = meta.get("size", 0)
+
+class ImageCache:
+    """按URL缓存代理图片的本地磁盘LRU缓存
+
+    - 图片内容和元数据（Content-Type、上游ETag/Last-Modified、抓取时间）
+      分别保存在 {dir}/{key[:2]}/{key} 和同名的 .json 文件中
+    - 总大小超过 max_bytes 时按最近访问时间淘汰
+    - 超过 ttl 秒的缓存会带上 If-None-Match / If-Modified-Since 向上游重新验证，
+      上游返回304时只刷新抓取时间；上游不可用时继续使用旧内容
+    - 本地内容的ETag为内容哈希，客户端可以据此获得304
+    - 上游请求共用一个保持长连接的 requests.Session（按域名复用连接池），
+      设置连接/读取超时，响应体分块写入临时文件，超过 max_image_bytes 立即中止
+    - 同一URL的并发未命中通过单飞合并，只向上游请求一次
+    """
+
+    def __init__(self, cache_dir="cache/images", max_bytes=256 * 1024 * 1024, ttl=86400,
+                 max_image_bytes=10 * 1024 * 1024, connect_timeout=3, read_timeout=10,
+                 pool_hosts=10, pool_size=20, chunk_size=64 * 1024, batch_workers=8):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_image_bytes = max_image_bytes
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_hosts = pool_hosts
+        self.pool_size = pool_size
+        self.chunk_size = chunk_size
+        self.batch_workers = batch_workers
+        self._executor = None
+        self._executor_pid = None
+        self._index = None  # key -> size，按访问顺序排列
+        self._total = 0
+        self._lock = threading.Lock()
+        self._session = None
+        self._session_pid = None
+        self._flight = SingleFlight("image_proxy")
+
+    def init_app(self, app):
+        """从应用配置中读取缓存目录、容量和重新验证间隔"""
+        self.cache_dir = os.path.abspath(app.config.get('IMAGE_CACHE_DIR', self.cache_dir))
+        self.max_bytes = app.config.get('IMAGE_CACHE_MAX_BYTES', self.max_bytes)
+        self.ttl = app.config.get('IMAGE_CACHE_TTL', self.ttl)
+        self.max_image_bytes = app.config.get('IMAGE_PROXY_MAX_BYTES', self.max_image_bytes)
+        self.connect_timeout = app.config.get('IMAGE_PROXY_CONNECT_TIMEOUT', self.connect_timeout)
+        self.read_timeout = app.config.get('IMAGE_PROXY_READ_TIMEOUT', self.read_timeout)
+        self.pool_hosts = app.config.get('IMAGE_PROXY_POOL_HOSTS', self.pool_hosts)
+        self.pool_size = app.config.get('IMAGE_PROXY_POOL_SIZE', self.pool_size)
+        self.batch_workers = app.config.get('IMAGE_PROXY_BATCH_WORKERS', self.batch_workers)
+        with self._lock:
+            self._index = None
+            self._total = 0
+            self._session = None
+            self._executor = None
+
+    @property
+    def session(self):
+        """共享的上游请求会话，fork 后的子进程重新创建"""
+        if self._session is None or self._session_pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._session_pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.pool_hosts, pool_maxsize=self.pool_size)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    session.headers.update(PROXY_HEADERS)
+                    self._session = session
+                    self._session_pid = os.getpid()
+        return self._session
+
+    def _paths(self, key):
+        shard = os.path.join(self.cache_dir, key[:2])
+        return os.path.join(shard, key), os.path.join(shard, key + ".json")
+
+    def _load_index(self):
+        """首次使用时扫描缓存目录，按文件访问时间建立LRU索引"""
+        if self._index is not None:
+            return
+        entries = []
+        if os.path.isdir(self.cache_dir):
+            for shard in os.listdir(self.cache_dir):
+                shard_dir = os.path.join(self.cache_dir, shard)
+                if not os.path.isdir(shard_dir):
+                    continue
+                for name in os.listdir(shard_dir):
+                    if name.endswith(".json") or name.startswith("."):
+                        continue
+                    try:
+                        stat = os.stat(os.path.join(shard_dir, name))
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, name, stat.st_size))
+        entries.sort()
+        self._index = OrderedDict((name, size) for _, name, size in entries)
+        self._total = sum(size for _, _, size in entries)
+
+    def _read_meta(self, key):
+        path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(path):
+            return None
+        return meta
+
+    def _write_meta(self, key, meta):
+        _, meta_path = self._paths(key)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(meta_path), prefix=".tmp-")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+    def _touch(self, key):
+        """记录一次访问"""
+        path, _ = self._paths(key)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self._load_index()
+            if key in self._index:
+                self._index.move_to_end(key)
+
+    def _remove(self, key):
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def store(self, key, url, chunks, content_type, upstream_etag=None, last_modified=None):
+        """分块写入图片内容和元数据，并在超出容量时淘汰最久未访问的图片
+
+        Args:
+            chunks: 图片内容的字节块迭代器，总大小超过 max_image_bytes 时抛出 ImageTooLarge
+        """
+        path, _ = self._paths(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_image_bytes:
+                        raise ImageTooLarge(f"图片超过大小限制: {url}")
+                    digest.update(chunk)
+                    f.write(chunk)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        meta = {
+            "url": url,
+            "content_type": content_type,
+            "upstream_etag": upstream_etag,
+            "last_modified": last_modified,
+            "etag": digest.hexdigest()[:32],
+            "size": size,
+            "fetched_at": time.time()
+        }
+        self._write_meta(key, meta)
+
+        evicted = []
+        with self._lock:
+            self._load_index()
+            self._total -= self._index.pop(key, 0)
+            self._index[key] = size
+            self._total += size
+            while self._total > self.max_bytes and len(self._index) > 1:
+                old_key, old_size = self._index.popitem(last=False)
+                self._total -= old_size
+                evicted.append(old_key)
+        for old_key in evicted:
+            self._remove(old_key)
+
+        return CachedImage(key, path, meta)
+
+    def fetch(self, url):
+        """获取图片，优先使用本地缓存，过期时向上游重新验证"""
+        key = cache_key(url)
+        path, _ = self._paths(key)
+        meta = self._read_meta(key)
+
+        if meta and time.time() - meta.get("fetched_at", 0) < self.ttl:
+            self._touch(key)
+            return CachedImage(key, path, meta)
+
+        return self._flight.do(key, self._fetch_upstream, url, key, meta)
+
+    def _fetch_upstream(self, url, key, meta):
+        """向上游请求图片（有旧缓存时做条件请求）并写入缓存"""
+        path, _ = self._paths(key)
+        headers = {}
+        if meta:
+            if meta.get("upstream_etag"):
+                headers["If-None-Match"] = meta["upstream_etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        try:
+            response = self.session.get(
+                url,
+                headers=headers,
+                stream=True,
+                timeout=(self.connect_timeout, self.read_timeout)
+            )
+        except requests.RequestException:
+            if meta:
+                # 上游不可用时继续使用旧内容
+                self._touch(key)
+                return CachedImage(key, path, meta)
+            raise
+
+        with response:
+            if response.status_code == 304 and meta:
+                meta["fetched_at"] = time.time()
+                self._write_meta(key, meta)
+                self._touch(key)
+                return CachedImage(key, path, meta)
+
+            try:
+                response.raise_for_status()
+            except requests.RequestException:
+                if meta:
+                    self._touch(key)
+                    return CachedImage(key, path, meta)
+                raise
+
+            # 声明的长度已经超限时不再下载
+            content_length = response.headers.get("Content-Length")
+            if content_length and content_length.isdigit() and int(content_length) > self.max_image_bytes:
+                raise ImageTooLarge(f"图片超过大小限制: {url}")
+
+            return self.store(
+                key,
+                url,
+                response.iter_content(chunk_size=self.chunk_size),
+                response.headers.get("Content-Type"),
+                response.headers.get("ETag"),
+                response.headers.get("Last-Modified")
+            )
+
+    @property
+    def executor(self):
+        """批量抓取使用的有界线程池，fork 后的子进程重新创建"""
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.batch_workers,
+                        thread_name_prefix="image-proxy"
+                    )
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def fetch_many(self, urls):
+        """批量获取图片，本地缓存未命中的图片在线程池中并发抓取
+
+        Returns:
+            dict: url -> CachedImage 或抓取时发生的异常
+        """
+        results = {}
+        pending = {}
+        for url in urls:
+            if url in results or url in pending:
+                continue
+            key = cache_key(url)
+            meta = self._read_meta(key)
+            if meta and time.time() - meta.get("fetched_at", 0) < self.ttl:
+                self._touch(key)
+                results[url] = CachedImage(key, self._paths(key)[0], meta)
+            else:
+                pending[url] = self.executor.submit(self.fetch, url)
+
+        for url, future in pending.items():
+            try:
+                results[url] = future.result()
+            except Exception as e:
+                results[url] = e
+        return results
+
+# 创建默认缓存实例
+image_cache = ImageCache()
@@ -4,7 +4,8 @@ import os
 import argparse
 from dotenv import load_dotenv
 from app import create_app
-from database import init_db
+from database import init_db, db
+from write_behind import cotton_candy_queue
 
 # 加载环境变量
 load_dotenv()
@@ -14,8 +15,62 @@ def parse_args():
     parser = argparse.ArgumentParser(description='歌曲列表后端服务')
     parser.add_argument('--init-db', action='store_true', help='初始化数据库')
     parser.add_argument('--reset-db', action='store_true', help='重置数据库（会删除现有数据）')
+    parser.add_argument('--serve', action='store_true',
+                        help='使用生产服务器（gunicorn，多进程+多线程）启动，也可设置环境变量 SERVER_MODE=production')
+    parser.add_argument('--compress-static', action='store_true',
+                        help='为前端构建产物生成 .gz/.br 预压缩文件')
+    parser.add_argument('--import-songs', metavar='FILE',
+                        help='从CSV（首行为表头）或JSONL文件批量导入歌曲')
+    parser.add_argument('--upsert', action='store_true',
+                        help='与 --import-songs 一起使用：按 (标题, 艺术家) 更新已有歌曲')
     return parser.parse_args()
 
+def shutdown_worker():
+    """工作进程退出：先写完延迟写入队列，再执行数据库检查点并关闭连接池"""
+    cotton_candy_queue.drain()
+    db.reset_pool()
+
+def serve(app, host, port):
+    """
+    使用 gunicorn 以多进程、多线程方式运行应用
+    
+    应用在主进程中创建一次后 fork 出各个工作进程（相当于 preload），
+    共享内存中的版本号等状态因此在各进程间共享；SQLite连接池在 fork 前关闭，
+    每个工作进程第一次访问数据库时各自重新建立连接。
+    """
+    from gunicorn.app.base import BaseApplication
+    
+    config = app.config
+    threads = config.get('WEB_THREADS', 8)
+    options = {
+        'bind': f"{host}:{port}",
+        'workers': config.get('WEB_WORKERS', 2),
+        'threads': threads,
+        'worker_class': 'gthread' if threads > 1 else 'sync',
+        'keepalive': config.get('WEB_KEEPALIVE', 5),
+        'timeout': config.get('WEB_TIMEOUT', 60),
+        'graceful_timeout': config.get('WEB_GRACEFUL_TIMEOUT', 30),
+        'max_requests': config.get('WEB_MAX_REQUESTS', 0),
+        'max_requests_jitter': config.get('WEB_MAX_REQUESTS', 0) // 10,
+        'limit_request_line': config.get('WEB_LIMIT_REQUEST_LINE', 4094),
+        'limit_request_field_size': config.get('WEB_LIMIT_REQUEST_FIELD_SIZE', 8190),
+        'accesslog': '-',
+        'errorlog': '-',
+        'when_ready': lambda server: db.reset_pool(),
+        'post_fork': lambda server, worker: db.reset_pool(),
+        'worker_exit': lambda server, worker: shutdown_worker(),
+    }
+    
+    class ProductionServer(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+        
+        def load(self):
+            return app
+    
+    ProductionServer().run()
+
 if __name__ == "__main__":
     # 解析命令行参数
     args = parse_args()
@@ -27,6 +82,42 @@ if __name__ == "__main__":
         print("数据库初始化完成！")
         exit(0)
     
+    if args.compress_static:
+        from config import get_config
+        from static_assets import StaticAssets
+        assets = StaticAssets(get_config().STATIC_BUILD_DIR)
+        assets.load()
+        print(f"正在预压缩 {assets.root} 下的静态文件...")
+        print(f"预压缩完成，生成 {assets.precompress()} 个文件")
+        exit(0)
+    
+    if args.import_songs:
+        import json
+        from config import get_config
+        from song_import import SongImporter, detect_format, iter_csv, iter_jsonl
+        config = get_config()
+        fmt = detect_format(args.import_songs)
+        if fmt is None:
+            print("仅支持 .csv 或 .jsonl 文件")
+            exit(1)
+        db.db_path = config.DB_PATH
+        init_db(reset=False)
+        importer = SongImporter(
+            db.get_connection,
+            chunk_size=config.SONG_IMPORT_CHUNK_SIZE,
+            upsert=args.upsert,
+            max_errors=config.SONG_IMPORT_MAX_ERRORS
+        )
+        print(f"正在导入 {args.import_songs} ...")
+        with open(args.import_songs, 'rb') as f:
+            report = importer.run(iter_csv(f) if fmt == "csv" else iter_jsonl(f))
+        for error in report["errors"]:
+            print(f"第{error['line']}行: {error['message']}")
+        del report["errors"]
+        print(f"导入完成: {json.dumps(report, ensure_ascii=False)}")
+        print(f"正在运行的服务会在 {config.CATALOG_VERSION_CHECK_INTERVAL} 秒内刷新歌曲目录缓存")
+        exit(0)
+    
     if args.reset_db:
         print("警告：即将重置数据库，所有现有数据将被删除！")
         confirm = input("确定要继续吗？(y/n): ")
@@ -46,6 +137,10 @@ if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
     debug = os.environ.get("FLASK_DEBUG", "false").lower() == "true"
     
-    # 启动应用
-    print(f"启动服务器 - {'调试模式' if debug else '生产模式'}")
-    app.run(host=host, port=port, debug=debug) 
\ No newline at end of file
+    if args.serve or os.environ.get("SERVER_MODE", "").lower() == "production":
+        print(f"启动生产服务器 - {app.config.get('WEB_WORKERS')}个进程 x {app.config.get('WEB_THREADS')}个线程")
+        serve(app, host, port)
+    else:
+        # 启动应用
+        print(f"启动服务器 - {'调试模式' if debug else '生产模式'}")
+        app.run(host=host, port=port, debug=debug)
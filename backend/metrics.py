@@ -0,0 +1,39 @@
+# metrics.py - 进程内运行指标
+import threading
+
+class Metrics:
+    """简单的进程内计数器和指标回调
+
+    计数器通过 incr 累加；gauge 注册一个无参函数，在读取指标时才调用，
+    用于暴露队列长度、缓存大小等实时数值。
+    """
+
+    def __init__(self):
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name, value=1):
+        """累加计数器"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def register_gauge(self, name, func):
+        """注册一个实时指标"""
+        with self._lock:
+            self._gauges[name] = func
+
+    def snapshot(self):
+        """返回当前所有指标"""
+        with self._lock:
+            result = dict(self._counters)
+            gauges = list(self._gauges.items())
+        for name, func in gauges:
+            try:
+                result[name] = func()
+            except Exception as e:
+                print(f"读取指标 {name} 失败: {str(e)}")
+        return dict(sorted(result.items()))
+
+# 创建默认指标实例
+metrics = Metrics()
@@ -0,0 +1,220 @@
+# notifications.py - 棉花糖未读数量的实时推送（Server-Sent Events）
+import json
+import os
+import queue
+import threading
+import time
+
+from database import db
+from metrics import metrics
+
+class TooManySubscribers(Exception):
+    """当前进程的推送连接数已达上限"""
+
+class UnreadNotifier:
+    """维护进程内的未读数量，并通过SSE推送给连接的管理员
+
+    未读数量和事件由数据库触发器写入 cotton_candy_stats / cotton_candy_events
+    （见数据库迁移5），因此不论哪个工作进程、哪条写入路径修改了棉花糖，
+    各进程只需按 id 增量读取事件日志即可得到最新的未读数量，不再扫描棉花糖表。
+
+    - 有连接时，后台线程每 poll_interval 秒读取一次新事件并分发给各连接；
+      本进程内的修改调用 wake() 立即触发一次读取
+    - 没有连接时不启动后台线程，unread() 在数据过期时同步读取一次
+    - 事件日志只保留最近 retain 条，读取事件和本进程写入后每 prune_interval 秒最多清理一次
+    """
+
+    def __init__(self, poll_interval=1.0, heartbeat=15, retain=10000, max_subscribers=4, prune_interval=60):
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        self.retain = retain
+        self.prune_interval = prune_interval
+        self.max_subscribers = max_subscribers
+        self._pid = None
+        self._last_id = 0
+        self._unread = 0
+        self._polled_at = 0
+        self._pruned_at = 0
+        self._subscribers = set()
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+
+    def init_app(self, app):
+        """从应用配置中读取轮询间隔、心跳间隔、事件保留条数、清理间隔和连接数上限"""
+        self.poll_interval = app.config.get('NOTIFY_POLL_INTERVAL', self.poll_interval)
+        self.heartbeat = app.config.get('NOTIFY_HEARTBEAT', self.heartbeat)
+        self.retain = app.config.get('NOTIFY_EVENT_RETAIN', self.retain)
+        self.prune_interval = app.config.get('NOTIFY_PRUNE_INTERVAL', self.prune_interval)
+        self.max_subscribers = app.config.get('NOTIFY_MAX_SUBSCRIBERS', self.max_subscribers)
+        with self._lock:
+            self._pid = None
+        metrics.register_gauge("notify.subscribers", lambda: len(self._subscribers))
+
+    def _ensure_loaded(self):
+        """按进程初始化：从当前的计数和最新事件开始（fork 后的子进程重新初始化）"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            conn = db.pool.acquire()
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT unread FROM cotton_candy_stats WHERE id = 1")
+                row = cur.fetchone()
+                cur.execute("SELECT COALESCE(MAX(id), 0) FROM cotton_candy_events")
+                last_id = cur.fetchone()[0]
+            finally:
+                conn.close()
+            self._unread = row[0] if row else 0
+            self._last_id = last_id
+            self._polled_at = time.monotonic()
+            self._subscribers = set()
+            self._thread = None
+            self._wakeup = threading.Event()
+            self._pid = os.getpid()
+
+    def poll(self):
+        """读取上次之后的新事件，更新未读数量并分发给所有连接"""
+        self._ensure_loaded()
+        with self._poll_lock:
+            conn = db.pool.acquire()
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                    SELECT e.id, e.type, e.candy_id, e.unread, e.created_at, c.sender, c.title
+                    FROM cotton_candy_events e
+                    LEFT JOIN cotton_candy c ON c.id = e.candy_id AND e.type = 'new'
+                    WHERE e.id > ?
+                    ORDER BY e.id
+                """, (self._last_id,))
+                rows = cur.fetchall()
+            finally:
+                conn.close()
+            self.prune()
+            self._polled_at = time.monotonic()
+            if not rows:
+                return
+
+            events = []
+            for row in rows:
+                event = {
+                    "type": row["type"],
+                    "id": row["candy_id"],
+                    "unread": row["unread"],
+                    "time": row["created_at"]
+                }
+                if row["type"] == "new":
+                    event["sender"] = row["sender"]
+                    event["title"] = row["title"]
+                events.append((row["id"], event))
+            self._last_id = rows[-1]["id"]
+            self._unread = rows[-1]["unread"]
+            metrics.incr("notify.events", len(events))
+
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            for item in events:
+                try:
+                    q.put_nowait(item)
+                except queue.Full:
+                    # 客户端太慢，丢弃事件；之后的事件仍带有最新的未读数量
+                    metrics.incr("notify.dropped")
+                    break
+
+    def prune(self):
+        """删除最近 retain 条以外的事件，每个进程每 prune_interval 秒最多执行一次
+
+        读取事件（poll）和本进程的写入（wake）都会调用，
+        没有管理员在线时事件日志也不会无限增长。
+        """
+        with self._lock:
+            if time.monotonic() - self._pruned_at < self.prune_interval:
+                return
+            self._pruned_at = time.monotonic()
+        conn = db.pool.acquire()
+        try:
+            conn.execute(
+                "DELETE FROM cotton_candy_events WHERE id <= (SELECT MAX(id) FROM cotton_candy_events) - ?",
+                (self.retain,)
+            )
+            conn.commit()
+        except Exception as e:
+            print(f"清理棉花糖事件错误: {str(e)}")
+        finally:
+            conn.close()
+
+    def wake(self):
+        """本进程修改了棉花糖：让下一次读取立即发生，并按需清理事件日志"""
+        self._polled_at = 0
+        self._wakeup.set()
+        self.prune()
+
+    def unread(self):
+        """返回未读数量，数据过期时先读取新事件"""
+        self._ensure_loaded()
+        if time.monotonic() - self._polled_at >= self.poll_interval:
+            self.poll()
+        return self._unread
+
+    def _poll_loop(self):
+        """后台线程：有连接时定期读取事件，没有连接后退出"""
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"读取棉花糖事件错误: {str(e)}")
+
+    def subscribe(self):
+        """注册一个推送连接，返回其事件队列
+
+        调用方必须保证最终调用 unsubscribe（例如 response.call_on_close），
+        不能只依赖 stream() 的 finally：响应体没有被迭代时它不会执行。
+        """
+        self._ensure_loaded()
+        q = queue.Queue(maxsize=1000)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribers("推送连接数已达上限")
+            self._subscribers.add(q)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._poll_loop, name="unread-notifier", daemon=True)
+                self._thread.start()
+        return q
+
+    def unsubscribe(self, q):
+        """释放一个推送连接，可以重复调用"""
+        with self._lock:
+            self._subscribers.discard(q)
+
+    @staticmethod
+    def format_event(data, event_id=None):
+        """格式化一条SSE消息"""
+        prefix = f"id: {event_id}\n" if event_id is not None else ""
+        return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    def stream(self, q):
+        """SSE响应体：先发送当前未读数量，之后推送事件，空闲时发送心跳注释"""
+        try:
+            yield "retry: 3000\n" + self.format_event({"type": "unread", "unread": self.unread()})
+            while True:
+                try:
+                    event_id, event = q.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                yield self.format_event(event, event_id)
+        finally:
+            self.unsubscribe(q)
+
+# 创建默认推送实例
+cotton_candy_notifier = UnreadNotifier()
@@ -0,0 +1,41 @@
+# pagination.py - 游标分页工具
+import base64
+import json
+
+def encode_cursor(*values):
+    """把上一页最后一条记录的排序键编码为不透明的游标字符串"""
+    raw = json.dumps(list(values), separators=(",", ":"), ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor, size):
+    """解码游标，返回排序键列表
+
+    Args:
+        cursor: encode_cursor 生成的游标
+        size: 排序键的个数
+
+    Raises:
+        ValueError: 游标格式不正确
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8"))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+
+    if (not isinstance(values, list) or len(values) != size
+            or not all(isinstance(v, (str, int, float)) and not isinstance(v, bool) for v in values)):
+        raise ValueError(f"无效的分页游标: {cursor}")
+    return values
+
+MAX_PER_PAGE = 100
+
+def page_args(args, default_per_page=10):
+    """读取并限制分页参数，返回 (page, per_page)
+
+    page 至少为1，per_page 限制在 1..MAX_PER_PAGE 之间，
+    避免 per_page<=0 时游标分页取不到最后一条、负数时 LIMIT 不生效
+    """
+    page = max(1, args.get("page", 1, type=int))
+    per_page = min(max(1, args.get("per_page", default_per_page, type=int)), MAX_PER_PAGE)
+    return page, per_page
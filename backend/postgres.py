@@ -0,0 +1,131 @@
+# postgres.py - PostgreSQL连接池
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.pool
+
+class PostgresPool:
+    """基于 psycopg2 ThreadedConnectionPool 的连接池
+
+    - 在 create_app 中通过 init_app 配置一次，首次取连接时才真正建立连接，
+      PostgreSQL 暂时不可用时不会影响应用启动
+    - 同时借出的连接数不超过 maxconn，池满时最多等待 timeout 秒
+    - 取出空闲过久的连接时先执行 SELECT 1 做健康检查，失效的连接直接丢弃
+    - 每个连接都设置 statement_timeout，防止慢查询占住连接
+    - 进程 fork 之后自动丢弃从父进程继承的连接池
+    """
+
+    def __init__(self, minconn=1, maxconn=10, timeout=5, statement_timeout=5000, healthcheck_interval=30):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.statement_timeout = statement_timeout
+        self.healthcheck_interval = healthcheck_interval
+        self.dsn = {}
+        self._pool = None
+        self._pid = None
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._last_used = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """从应用配置中读取连接参数和连接池大小"""
+        self.close()
+        self.dsn = {
+            "host": app.config.get('POSTGRES_HOST'),
+            "port": app.config.get('POSTGRES_PORT'),
+            "database": app.config.get('POSTGRES_DB'),
+            "user": app.config.get('POSTGRES_USER'),
+            "password": app.config.get('POSTGRES_PASSWORD')
+        }
+        self.minconn = app.config.get('POSTGRES_POOL_MIN', self.minconn)
+        self.maxconn = app.config.get('POSTGRES_POOL_MAX', self.maxconn)
+        self.timeout = app.config.get('POSTGRES_POOL_TIMEOUT', self.timeout)
+        self.statement_timeout = app.config.get('POSTGRES_STATEMENT_TIMEOUT', self.statement_timeout)
+        self.healthcheck_interval = app.config.get('POSTGRES_HEALTHCHECK_INTERVAL', self.healthcheck_interval)
+        self._slots = threading.BoundedSemaphore(self.maxconn)
+
+    def _get_pool(self):
+        """懒加载连接池，fork 后重新创建"""
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = psycopg2.pool.ThreadedConnectionPool(
+                    self.minconn,
+                    self.maxconn,
+                    options=f"-c statement_timeout={int(self.statement_timeout)}",
+                    **self.dsn
+                )
+                self._pid = os.getpid()
+                self._last_used = {}
+                self._slots = threading.BoundedSemaphore(self.maxconn)
+            return self._pool, self._slots
+
+    def _is_healthy(self, conn):
+        """检查连接是否可用，最近用过的连接跳过 SELECT 1"""
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn), 0)
+        if time.monotonic() - last_used < self.healthcheck_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @contextmanager
+    def connection(self):
+        """借出一个连接，退出时无论是否发生异常都会归还
+
+        正常退出时提交事务，发生异常时回滚；连接已断开时从池中移除。
+        """
+        pool, slots = self._get_pool()
+        if not slots.acquire(timeout=self.timeout):
+            raise psycopg2.pool.PoolError("PostgreSQL连接池已满")
+        conn = None
+        try:
+            for _ in range(self.maxconn + 1):
+                conn = pool.getconn()
+                if self._is_healthy(conn):
+                    break
+                self._last_used.pop(id(conn), None)
+                pool.putconn(conn, close=True)
+                conn = None
+            if conn is None:
+                raise psycopg2.OperationalError("无法获取可用的PostgreSQL连接")
+
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                if not conn.closed:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        pass
+                raise
+        finally:
+            if conn is not None:
+                if conn.closed:
+                    self._last_used.pop(id(conn), None)
+                    pool.putconn(conn, close=True)
+                else:
+                    self._last_used[id(conn)] = time.monotonic()
+                    pool.putconn(conn)
+            slots.release()
+
+    def close(self):
+        """关闭连接池中的所有连接"""
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.closeall()
+            self._pool = None
+            self._pid = None
+
+# 创建默认连接池实例
+pg_pool = PostgresPool()
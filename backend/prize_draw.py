@@ -0,0 +1,135 @@
+# prize_draw.py - 服务端奖品抽取（Vose别名法）
+import multiprocessing
+import random
+import threading
+
+try:
+    import numpy as np
+except ImportError:  # 未安装NumPy时批量抽取也使用纯Python实现
+    np = None
+
+# 未中奖的结果，与前端转盘保持一致
+NO_PRIZE = {"id": None, "name": "未中奖", "image": ""}
+
+class AliasTable:
+    """按奖品概率构建的 Vose 别名表，每次抽取 O(1)
+
+    概率的含义与前端转盘相同：按顺序累加，累计超过1的部分无效，
+    总和不足1的部分为“未中奖”。
+    """
+
+    def __init__(self, prizes):
+        outcomes = []
+        weights = []
+        cumulative = 0.0
+        for prize in prizes:
+            probability = max(float(prize["probability"]), 0.0)
+            weight = min(cumulative + probability, 1.0) - min(cumulative, 1.0)
+            cumulative += probability
+            if weight > 0:
+                outcomes.append({"id": prize["id"], "name": prize["name"], "image": prize["image"]})
+                weights.append(weight)
+        if cumulative < 1.0:
+            outcomes.append(NO_PRIZE)
+            weights.append(1.0 - cumulative)
+
+        self.outcomes = outcomes
+        self.prob, self.alias = self._build(weights)
+        if np is not None:
+            self._np_prob = np.array(self.prob)
+            self._np_alias = np.array(self.alias)
+
+    @staticmethod
+    def _build(weights):
+        """Vose 算法：把 n 个权重拆成 n 个“自身概率 + 别名”的桶"""
+        n = len(weights)
+        total = sum(weights)
+        scaled = [w * n / total for w in weights]
+        prob = [0.0] * n
+        alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+        # 剩余的桶由于浮点误差应当都接近1
+        for i in large + small:
+            prob[i] = 1.0
+        return prob, alias
+
+    def draw(self, rng):
+        """抽取一次，返回结果下标"""
+        i = rng.randrange(len(self.prob))
+        return i if rng.random() < self.prob[i] else self.alias[i]
+
+    def draw_many(self, n, seed=None, rng=None):
+        """批量抽取 n 次，返回结果下标列表
+
+        安装了NumPy时整体向量化计算；同一个seed在两种实现下的结果不同。
+        """
+        if np is not None:
+            generator = np.random.default_rng(seed)
+            buckets = generator.integers(0, len(self.prob), size=n)
+            accept = generator.random(n) < self._np_prob[buckets]
+            return np.where(accept, buckets, self._np_alias[buckets]).tolist()
+        rng = rng or random.Random(seed)
+        return [self.draw(rng) for _ in range(n)]
+
+class PrizeDrawEngine:
+    """按用户缓存别名表的抽奖引擎
+
+    保存奖品时调用 invalidate() 递增共享内存中的版本号，所有进程里
+    旧版本的别名表都会在下次抽取时重建。
+    """
+
+    def __init__(self, vectorize_threshold=1000):
+        self.vectorize_threshold = vectorize_threshold
+        self._version = multiprocessing.Value('q', 0)
+        self._tables = {}  # user_id -> (版本号, AliasTable)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """从应用配置中读取向量化阈值"""
+        self.vectorize_threshold = app.config.get('PRIZE_DRAW_VECTORIZE_THRESHOLD', self.vectorize_threshold)
+        with self._lock:
+            self._tables.clear()
+
+    def invalidate(self, user_id=None):
+        """奖品发生变化，使缓存的别名表失效"""
+        with self._version.get_lock():
+            self._version.value += 1
+        with self._lock:
+            if user_id is None:
+                self._tables.clear()
+            else:
+                self._tables.pop(user_id, None)
+
+    def get_table(self, user_id, load_prizes):
+        """获取用户的别名表，缓存失效时调用 load_prizes() 重新构建"""
+        version = self._version.value
+        with self._lock:
+            cached = self._tables.get(user_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        table = AliasTable(load_prizes())
+        with self._lock:
+            self._tables[user_id] = (version, table)
+        return table
+
+    def draw(self, table, n=1, seed=None):
+        """抽取 n 次，返回结果下标列表"""
+        if n >= self.vectorize_threshold:
+            return table.draw_many(n, seed)
+        rng = random.Random(seed) if seed is not None else random.SystemRandom()
+        return [table.draw(rng) for _ in range(n)]
+
+# 创建默认抽奖引擎实例
+prize_draw = PrizeDrawEngine()
@@ -0,0 +1,83 @@
+# serialization.py - 查询结果转换与JSON序列化
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # 未安装orjson时使用标准库json
+    orjson = None
+
+# 各接口返回的字段，查询时按同样的顺序选取列
+SONG_FIELDS = ("id", "title", "artist", "album", "genre", "year", "meta_data", "tags")
+COTTON_CANDY_FIELDS = ("id", "sender", "title", "content", "create_time", "read")
+GUARD_FIELDS = (
+    "id", "room_id", "ruid", "uid", "rank", "accompany",
+    "username", "face", "name_color", "is_mystery",
+    "medal_name", "medal_level", "medal_color_start",
+    "medal_color_end", "medal_color_border", "medal_color",
+    "guard_level", "expired_str", "is_top3", "timestamp"
+)
+
+def columns(fields, table=None):
+    """生成 SELECT 的列清单，如 columns(SONG_FIELDS, "songs") -> "songs.id, songs.title, ..." """
+    if table is None:
+        return ", ".join(fields)
+    return ", ".join(f"{table}.{field}" for field in fields)
+
+def rows_to_dicts(cursor, rows, converters=None):
+    """按游标的列名把查询结果一次性转换为可直接序列化的字典列表
+
+    适用于 sqlite3.Row、psycopg2 的元组/DictRow 等可迭代的行，
+    输出的键就是 SELECT 的列名，不再逐个字段手工复制。
+
+    Args:
+        converters: 列名 -> 转换函数，如 {"read": bool}
+    """
+    names = [d[0] for d in cursor.description]
+    result = [dict(zip(names, row)) for row in rows]
+    if converters:
+        for item in result:
+            for name, convert in converters.items():
+                item[name] = convert(item[name])
+    return result
+
+def row_to_dict(cursor, row, converters=None):
+    """单行版本的 rows_to_dicts，row 为 None 时返回 None"""
+    if row is None:
+        return None
+    return rows_to_dicts(cursor, [row], converters)[0]
+
+class ORJSONProvider(DefaultJSONProvider):
+    """使用 orjson 的 Flask JSON 提供者，未安装 orjson 时与默认实现相同
+
+    输出语义与默认实现保持一致：按键排序，日期时间等类型仍交给
+    DefaultJSONProvider.default 处理（HTTP日期格式）；调试模式的缩进输出
+    和带额外参数的调用回退到标准库。
+    """
+
+    def _option(self):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+    def dumps_bytes(self, obj):
+        """序列化为UTF-8字节"""
+        if orjson is None:
+            return super().dumps(obj).encode("utf-8")
+        return orjson.dumps(obj, default=self.default, option=self._option())
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None or self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b"\n", mimetype=self.mimetype)
@@ -0,0 +1,58 @@
+# singleflight.py - 合并并发的相同请求
+import threading
+
+from metrics import metrics
+
+class _Call:
+    """一次正在进行的计算"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """单飞（single-flight）请求合并
+
+    同一个键同时只执行一次计算：第一个调用者负责执行，其余并发调用者
+    等待并共享它的结果或异常。计算结束后键即被移除，之后的调用会重新执行。
+    执行次数和被合并的次数记录在 singleflight.{name}.executed / .coalesced 指标中。
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def in_flight(self, key):
+        """该键当前是否有正在进行的计算"""
+        with self._lock:
+            return key in self._calls
+
+    def do(self, key, func, *args, **kwargs):
+        """执行 func(*args, **kwargs)，相同键的并发调用只执行一次"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            metrics.incr(f"singleflight.{self.name}.coalesced")
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.incr(f"singleflight.{self.name}.executed")
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
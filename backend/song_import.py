@@ -0,0 +1,178 @@
+# song_import.py - 歌曲批量导入（CSV / JSONL）
+import codecs
+import csv
+import io
+import json
+
+def _text(data, name):
+    value = data.get(name) or ""
+    if not isinstance(value, str):
+        value = str(value)
+    return value.strip()
+
+def validate_song(data):
+    """按创建歌曲接口的规则校验并整理一条歌曲数据
+
+    Returns:
+        tuple: (title, artist, album, genre, year, meta_data, tags)
+
+    Raises:
+        ValueError: 数据不合法，消息可直接返回给前端
+    """
+    if not isinstance(data, dict):
+        raise ValueError("歌曲数据格式错误")
+
+    title = _text(data, "title")
+    artist = _text(data, "artist")
+
+    # 基本验证
+    if not title or not artist:
+        raise ValueError("歌曲标题和艺术家不能为空")
+
+    # 提取其他字段
+    album = _text(data, "album")
+    genre = _text(data, "genre")
+    year = data.get("year")
+    if year == "":
+        year = None
+    meta_data = data.get("meta_data", "")
+    if isinstance(meta_data, (dict, list)):
+        meta_data = json.dumps(meta_data, ensure_ascii=False)
+    tags = _text(data, "tags")
+    return (title, artist, album, genre, year, meta_data, tags)
+
+def iter_csv(stream):
+    """逐行解析CSV（首行为表头），产生 (行号, 字典)"""
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+    for row in reader:
+        yield reader.line_num, row
+
+def iter_jsonl(stream):
+    """逐行解析JSONL，每行一个JSON对象，产生 (行号, 字典或解析错误)"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    for line_num, line in enumerate(stream, start=1):
+        line = decoder.decode(line).strip()
+        if not line:
+            continue
+        try:
+            yield line_num, json.loads(line)
+        except ValueError as e:
+            yield line_num, ValueError(f"JSON格式错误: {str(e)}")
+
+def detect_format(filename=None, content_type=None):
+    """根据文件名或 Content-Type 判断导入格式，无法判断时返回None"""
+    name = (filename or "").lower()
+    content_type = (content_type or "").lower()
+    if name.endswith(".csv") or "csv" in content_type:
+        return "csv"
+    if name.endswith((".jsonl", ".ndjson")) or "ndjson" in content_type or "jsonl" in content_type:
+        return "jsonl"
+    return None
+
+class SongImporter:
+    """流式导入歌曲
+
+    边解析边校验，每 chunk_size 条在一个事务中用 executemany 写入，
+    不会把整个文件读进内存；某一行不合法只记录到错误报告中，不影响其他行。
+    upsert 为 True 时，(标题, 艺术家) 已存在的歌曲改为更新其他字段（数据库中的重复歌曲都会更新，
+    updated 为实际更新的行数），同一文件中重复的歌曲以最后一行为准。
+    """
+
+    def __init__(self, get_connection, chunk_size=1000, upsert=False, max_errors=1000):
+        self.get_connection = get_connection
+        self.chunk_size = chunk_size
+        self.upsert = upsert
+        self.max_errors = max_errors
+        self.total = 0
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "message": message})
+
+    def run(self, rows):
+        """导入 (行号, 数据) 序列，返回导入报告"""
+        chunk = []
+        for line, data in rows:
+            self.total += 1
+            try:
+                if isinstance(data, Exception):
+                    raise data
+                chunk.append((line, validate_song(data)))
+            except ValueError as e:
+                self.error(line, str(e))
+                continue
+            if len(chunk) >= self.chunk_size:
+                self._write(chunk)
+                chunk = []
+        if chunk:
+            self._write(chunk)
+        return self.report()
+
+    def _write(self, chunk):
+        """在一个事务中写入一批"""
+        conn = self.get_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute("BEGIN IMMEDIATE")
+            if self.upsert:
+                inserts, updates = self._split_existing(cur, chunk)
+            else:
+                inserts, updates = [values for _, values in chunk], []
+            cur.executemany("""
+                INSERT INTO songs (title, artist, album, genre, year, meta_data, tags)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, inserts)
+            cur.executemany("""
+                UPDATE songs SET album = ?, genre = ?, year = ?, meta_data = ?, tags = ?
+                WHERE title = ? AND artist = ?
+            """, updates)
+            # 数据库中可能已有多首同名同艺术家的歌曲，按实际更新的行数统计
+            updated = cur.rowcount if updates else 0
+            conn.commit()
+            self.inserted += len(inserts)
+            self.updated += updated
+        except Exception as e:
+            conn.rollback()
+            print(f"批量导入歌曲错误: {str(e)}")
+            for line, _ in chunk:
+                self.error(line, f"写入数据库失败: {str(e)}")
+        finally:
+            conn.close()
+
+    def _split_existing(self, cur, chunk):
+        """把一批数据分成新增和更新两部分，同一批中重复的 (标题, 艺术家) 只保留最后一行"""
+        latest = {}
+        for _, values in chunk:
+            latest[(values[0], values[1])] = values
+        self.duplicates += len(chunk) - len(latest)
+
+        titles = list({title for title, _ in latest})
+        placeholders = ",".join("?" * len(titles))
+        cur.execute(f"SELECT DISTINCT title, artist FROM songs WHERE title IN ({placeholders})", titles)
+        existing = {(row[0], row[1]) for row in cur.fetchall()}
+
+        inserts = []
+        updates = []
+        for key, values in latest.items():
+            if key in existing:
+                updates.append(values[2:] + key)
+            else:
+                inserts.append(values)
+        return inserts, updates
+
+    def report(self):
+        return {
+            "total": self.total,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "failed": self.failed,
+            "duplicates": self.duplicates,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors)
+        }
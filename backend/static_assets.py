@@ -0,0 +1,189 @@
+# static_assets.py - 前端构建产物（build/）的静态文件服务
+import gzip
+import mimetypes
+import os
+import re
+import shutil
+
+from flask import Response, request, send_file
+from werkzeug.exceptions import NotFound
+
+from compression import match_etag
+
+try:
+    import brotli
+except ImportError:  # 未安装brotli时只生成和使用 .gz 预压缩文件
+    brotli = None
+
+# 构建工具生成的带内容哈希的文件名，如 main.3f2a1b9c.js、logo.6ce24c58023cc2f8fd88.svg
+HASHED_NAME_RE = re.compile(r"\.[0-9a-f]{8,}\.(?:chunk\.)?[A-Za-z0-9]+$")
+
+# 值得预压缩的文件类型；图片、音视频等本身已压缩的格式不在其中
+COMPRESSIBLE_EXTENSIONS = {
+    ".html", ".js", ".css", ".json", ".map", ".svg", ".txt", ".xml", ".ico", ".moc3", ".wasm"
+}
+
+# 预压缩文件的扩展名，按优先顺序排列
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+mimetypes.add_type("application/javascript", ".js")
+mimetypes.add_type("application/wasm", ".wasm")
+
+class Asset:
+    """清单中的一个静态文件"""
+
+    def __init__(self, path, relative_path, stat):
+        self.path = path
+        self.mimetype = mimetypes.guess_type(relative_path)[0] or "application/octet-stream"
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.etag = f"{int(stat.st_mtime):x}-{stat.st_size:x}"
+        self.immutable = HASHED_NAME_RE.search(relative_path) is not None
+        self.encodings = {}  # 编码 -> 预压缩文件路径
+
+class StaticAssets:
+    """前端单页应用和 Live2D 模型文件的静态服务
+
+    - 启动时扫描一次 build/ 生成文件清单，请求时只查字典，不再访问文件系统判断是否存在
+    - 客户端支持时返回同目录下预压缩好的 .br / .gz 文件
+    - 文件名带内容哈希的资源设置一年的 immutable 缓存，其他文件按 max_age 缓存并用ETag重新验证
+    - 通过 send_file 支持 Range 和条件请求，大的模型文件可以断点续传；
+      Range 请求总是返回未压缩的原文件，保证字节范围有意义
+    - index.html 常驻内存，前端路由的所有页面都直接返回它
+    """
+
+    def __init__(self, root="build", max_age=3600, immutable_max_age=31536000):
+        self.root = os.path.abspath(root)
+        self.max_age = max_age
+        self.immutable_max_age = immutable_max_age
+        self.manifest = {}
+        self.index_body = None
+        self.index_etag = None
+
+    def init_app(self, app):
+        """从应用配置中读取构建目录和缓存时间，并生成文件清单"""
+        self.root = os.path.abspath(app.config.get('STATIC_BUILD_DIR', 'build'))
+        self.max_age = app.config.get('STATIC_MAX_AGE', self.max_age)
+        self.immutable_max_age = app.config.get('STATIC_IMMUTABLE_MAX_AGE', self.immutable_max_age)
+        self.load()
+
+    def load(self):
+        """扫描构建目录，生成 相对路径 -> Asset 的清单"""
+        manifest = {}
+        siblings = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                relative_path = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if name.endswith((".br", ".gz")):
+                    siblings.append(relative_path)
+                    continue
+                manifest[relative_path] = Asset(path, relative_path, os.stat(path))
+
+        # 只使用不比原文件旧的预压缩文件，避免重新构建后返回过期内容
+        for relative_path in siblings:
+            for encoding, suffix in ENCODINGS:
+                if not relative_path.endswith(suffix):
+                    continue
+                asset = manifest.get(relative_path[:-len(suffix)])
+                path = os.path.join(self.root, relative_path)
+                if asset is not None and os.stat(path).st_mtime >= asset.mtime:
+                    asset.encodings[encoding] = path
+
+        index = manifest.get("index.html")
+        if index is not None:
+            with open(index.path, "rb") as f:
+                self.index_body = f.read()
+            self.index_etag = index.etag
+        else:
+            self.index_body = None
+            self.index_etag = None
+        self.manifest = manifest
+
+    def precompress(self, min_size=1024, level=9):
+        """为清单中可压缩的文件生成 .gz（以及安装了brotli时的 .br）预压缩文件
+
+        压缩后没有变小的文件不保存。一般在构建镜像时执行一次。
+
+        Returns:
+            int: 新生成的文件数
+        """
+        created = 0
+        for relative_path, asset in self.manifest.items():
+            _, ext = os.path.splitext(relative_path)
+            if ext.lower() not in COMPRESSIBLE_EXTENSIONS or asset.size < min_size:
+                continue
+            with open(asset.path, "rb") as f:
+                data = f.read()
+            for encoding, suffix in ENCODINGS:
+                if encoding == "br":
+                    if brotli is None:
+                        continue
+                    compressed = brotli.compress(data, quality=11)
+                else:
+                    compressed = gzip.compress(data, compresslevel=level, mtime=0)
+                if len(compressed) >= asset.size:
+                    continue
+                target = asset.path + suffix
+                tmp_path = target + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(compressed)
+                shutil.copystat(asset.path, tmp_path)
+                os.replace(tmp_path, target)
+                created += 1
+        self.load()
+        return created
+
+    def _choose_encoding(self, asset):
+        """按 Accept-Encoding 选择可用的预压缩文件"""
+        if not asset.encodings or request.range is not None:
+            return None, asset.path
+        for encoding, _ in ENCODINGS:
+            path = asset.encodings.get(encoding)
+            if path is not None and request.accept_encodings[encoding] > 0:
+                return encoding, path
+        return None, asset.path
+
+    def index_response(self):
+        """返回内存中的 index.html，每次都需要重新验证"""
+        if self.index_body is None:
+            raise NotFound()
+        # index.html 可能被 compressor 压缩并改用 {ETag}-{编码}，两种形式都视为命中
+        matched = match_etag(self.index_etag)
+        if matched:
+            response = Response(status=304)
+            response.set_etag(matched)
+        else:
+            response = Response(self.index_body, mimetype="text/html")
+            response.set_etag(self.index_etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    def serve(self, path):
+        """返回 build/ 下的文件，不存在的路径交给前端路由（返回 index.html）"""
+        asset = self.manifest.get(path)
+        if asset is None or path == "index.html":
+            return self.index_response()
+
+        encoding, file_path = self._choose_encoding(asset)
+        etag = asset.etag if encoding is None else f"{asset.etag}-{encoding}"
+        max_age = self.immutable_max_age if asset.immutable else self.max_age
+        response = send_file(
+            file_path,
+            mimetype=asset.mimetype,
+            etag=etag,
+            last_modified=asset.mtime,
+            max_age=max_age,
+            conditional=True
+        )
+        response.cache_control.public = True
+        if asset.immutable:
+            response.cache_control.immutable = True
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+        if asset.encodings:
+            response.vary.add("Accept-Encoding")
+        return response
+
+# 创建默认静态文件服务实例
+static_assets = StaticAssets()
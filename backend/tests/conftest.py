@@ -0,0 +1,5 @@
+# conftest.py - 让测试可以像应用一样直接导入 backend 下的模块
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -0,0 +1,153 @@
+# test_query_plans.py - 检查热点查询在大数据量下都走索引，不退化为全表扫描
+import re
+
+import pytest
+
+from database import Database
+from serialization import columns, COTTON_CANDY_FIELDS, SONG_FIELDS
+
+ROWS = 20000
+
+FTS_SOURCE = "songs_fts JOIN songs ON songs.id = songs_fts.rowid"
+FTS_TERM = '"歌曲12"'
+
+# 明确允许的计划行：
+# - 按 rowid 倒序遍历 songs 表：ORDER BY songs.id DESC LIMIT 取够行数即停止，不是全表扫描
+# - 全文索引的虚拟表查询
+# - 全文搜索结果按相关度/id排序：只对命中的行排序
+ROWID_SCAN = re.compile(r"^SCAN songs$")
+FTS_SCAN = re.compile(r"^SCAN songs_fts VIRTUAL TABLE INDEX \d+:")
+FTS_SORT = re.compile(r"^USE TEMP B-TREE FOR ORDER BY$")
+
+# 与 app.py 中各接口使用的查询保持一致：名称 -> (查询, 参数[, 允许的计划行])
+# 搜索词少于3个字符时的 LIKE '%词%' 回退无法使用索引，不在检查范围内
+QUERIES = {
+    "songs_page": (
+        f"SELECT {columns(SONG_FIELDS, 'songs')} FROM songs ORDER BY songs.id DESC LIMIT ? OFFSET ?",
+        (10, 0),
+        (ROWID_SCAN,)
+    ),
+    "songs_count": (
+        "SELECT COUNT(*) FROM songs",
+        ()
+    ),
+    "songs_search_page": (
+        f"SELECT {columns(SONG_FIELDS, 'songs')} FROM {FTS_SOURCE} WHERE songs_fts MATCH ? ORDER BY bm25(songs_fts), songs.id DESC LIMIT ? OFFSET ?",
+        (FTS_TERM, 10, 0),
+        (FTS_SCAN, FTS_SORT)
+    ),
+    "songs_search_count": (
+        "SELECT COUNT(*) FROM songs_fts WHERE songs_fts MATCH ?",
+        (FTS_TERM,),
+        (FTS_SCAN,)
+    ),
+    "songs_search_cursor": (
+        f"SELECT {columns(SONG_FIELDS, 'songs')} FROM {FTS_SOURCE} WHERE songs_fts MATCH ? AND songs.id < ? ORDER BY songs.id DESC LIMIT ?",
+        (FTS_TERM, 100, 11),
+        (FTS_SCAN, FTS_SORT)
+    ),
+    "cotton_candy_list": (
+        f"SELECT {columns(COTTON_CANDY_FIELDS)} FROM cotton_candy ORDER BY create_time DESC, id DESC LIMIT ? OFFSET ?",
+        (10, 0)
+    ),
+    "cotton_candy_list_by_read": (
+        f"SELECT {columns(COTTON_CANDY_FIELDS)} FROM cotton_candy WHERE read = ? ORDER BY create_time DESC, id DESC LIMIT ? OFFSET ?",
+        (0, 10, 0)
+    ),
+    "cotton_candy_cursor": (
+        f"SELECT {columns(COTTON_CANDY_FIELDS)} FROM cotton_candy WHERE (create_time, id) < (?, ?) ORDER BY create_time DESC, id DESC LIMIT ?",
+        ("2026-01-01 00:00:00", 100, 11)
+    ),
+    "cotton_candy_cursor_by_read": (
+        f"SELECT {columns(COTTON_CANDY_FIELDS)} FROM cotton_candy WHERE read = ? AND (create_time, id) < (?, ?) ORDER BY create_time DESC, id DESC LIMIT ?",
+        (0, "2026-01-01 00:00:00", 100, 11)
+    ),
+    "cotton_candy_count_by_read": (
+        "SELECT COUNT(*) FROM cotton_candy WHERE read = ?",
+        (0,)
+    ),
+    "unread_count": (
+        "SELECT COUNT(*) FROM cotton_candy WHERE read = 0",
+        ()
+    ),
+    "unread_count_stats": (
+        "SELECT unread FROM cotton_candy_stats WHERE id = 1",
+        ()
+    ),
+    "prizes_by_user": (
+        "SELECT id, name, probability, image FROM prizes WHERE user_id = ? ORDER BY id",
+        (1,)
+    ),
+    "song_by_id": (
+        f"SELECT {columns(SONG_FIELDS)} FROM songs WHERE id = ?",
+        (1,)
+    ),
+    "songs_cursor": (
+        f"SELECT {columns(SONG_FIELDS, 'songs')} FROM songs WHERE songs.id < ? ORDER BY songs.id DESC LIMIT ?",
+        (100, 11)
+    ),
+    "songs_by_title_artist": (
+        "SELECT DISTINCT title, artist FROM songs WHERE title IN (?, ?)",
+        ("歌曲1", "歌曲2")
+    ),
+}
+
+# 不带 USING ... INDEX 的 SCAN 即全表扫描
+FULL_SCAN_RE = re.compile(r"^SCAN (\w+)(?!.*\bUSING\b.*\bINDEX\b)")
+
+@pytest.fixture(scope="module")
+def db(tmp_path_factory):
+    """通过迁移建立数据库，并写入足够多的数据让查询规划器在意全表扫描的代价"""
+    database = Database(db_path=str(tmp_path_factory.mktemp("db") / "songs.db"))
+    database.migrate()
+    conn = database.pool.acquire()
+    conn.executemany(
+        "INSERT INTO users (username, password) VALUES (?, ?)",
+        [(f"user{i}", "x") for i in range(100)]
+    )
+    conn.executemany(
+        "INSERT INTO prizes (user_id, name, probability, image) VALUES (?, ?, ?, '')",
+        [(i % 100 + 1, f"奖品{i}", 0.1) for i in range(ROWS)]
+    )
+    conn.executemany(
+        "INSERT INTO songs (title, artist, album) VALUES (?, ?, ?)",
+        [(f"歌曲{i}", f"歌手{i % 500}", f"专辑{i % 50}") for i in range(ROWS)]
+    )
+    conn.executemany(
+        "INSERT INTO cotton_candy (sender, title, content, create_time, read) VALUES (?, ?, ?, datetime('2026-01-01', ?), ?)",
+        [("匿名", f"标题{i}", "内容", f"-{i} minutes", i % 3 == 0) for i in range(ROWS)]
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+    yield database
+    database.reset_pool()
+
+@pytest.mark.parametrize("name", list(QUERIES))
+def test_query_uses_index(db, name):
+    query, params, *rest = QUERIES[name]
+    allowed = rest[0] if rest else ()
+    conn = db.pool.acquire()
+    try:
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + query, params)]
+    finally:
+        conn.close()
+
+    plan = [detail for detail in plan if not any(pattern.match(detail) for pattern in allowed)]
+    full_scans = [detail for detail in plan if FULL_SCAN_RE.match(detail)]
+    assert not full_scans, f"{name} 退化为全表扫描: {plan}"
+    if "ORDER BY" in query:
+        assert not any("TEMP B-TREE" in detail for detail in plan), f"{name} 需要额外排序: {plan}"
+
+def test_rowid_scan_stops_at_limit(db):
+    """按 rowid 倒序分页时 SQLite 只读取 LIMIT 行，允许的 SCAN songs 确实不会读完整张表"""
+    conn = db.pool.acquire()
+    try:
+        query, params, _ = QUERIES["songs_page"]
+        steps = []
+        conn.set_progress_handler(lambda: steps.append(1), 100)
+        conn.execute(query, params).fetchall()
+        conn.set_progress_handler(None, 100)
+    finally:
+        conn.close()
+    assert len(steps) * 100 < ROWS, "歌曲分页读取了整张表"
@@ -0,0 +1,238 @@
+# uploads.py - 按内容寻址的上传文件存储
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from werkzeug.security import safe_join
+
+try:
+    from PIL import Image
+except ImportError:  # 未安装Pillow时不生成缩略图，直接返回原图
+    Image = None
+
+# 内容寻址文件的相对路径：两级分片目录 + sha256 + 扩展名
+HASHED_PATH_RE = re.compile(r"^([0-9a-f]{2})/([0-9a-f]{2})/([0-9a-f]{64})(\.[a-z0-9]+)?$")
+
+# 常见图片格式的文件头
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+    (b"BM", ".bmp"),
+    (b"\x00\x00\x01\x00", ".ico"),
+)
+
+class UploadStore:
+    """按内容寻址的上传文件存储
+
+    上传内容边写入临时文件边计算 sha256，相同内容只保存一份，
+    存放在 {folder}/{hash[:2]}/{hash[2:4]}/{hash}{ext} 两级分片目录下（扩展名由文件内容判断），
+    返回的URL只由内容决定，因此可以设置永久缓存，并以哈希作为ETag。
+    """
+
+    def __init__(self, folder="uploads", chunk_size=64 * 1024):
+        self.folder = os.path.abspath(folder)
+        self.chunk_size = chunk_size
+
+    def init_app(self, app):
+        """从应用配置中读取上传目录"""
+        self.folder = os.path.abspath(app.config.get('UPLOAD_FOLDER', 'uploads'))
+        os.makedirs(self.folder, exist_ok=True)
+
+    @staticmethod
+    def sniff_extension(header):
+        """根据文件开头的字节判断图片格式，返回扩展名，无法识别时返回空字符串
+
+        扩展名只由内容决定（不使用客户端提供的文件名），
+        相同内容无论以什么文件名上传都只保存一份、对应同一个URL。
+        """
+        for signature, ext in IMAGE_SIGNATURES:
+            if header.startswith(signature):
+                return ext
+        if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+            return ".webp"
+        if header[4:8] == b"ftyp" and header[8:12] in (b"avif", b"avis"):
+            return ".avif"
+        text = header[:1024].lstrip().lower()
+        if text.startswith((b"<svg", b"<?xml")) and b"<svg" in text:
+            return ".svg"
+        return ""
+
+    def save(self, file):
+        """流式保存上传文件，返回相对于上传目录的路径
+
+        Args:
+            file: werkzeug FileStorage 对象
+        """
+        tmp_dir = os.path.join(self.folder, ".tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        digest = hashlib.sha256()
+        header = b""
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while True:
+                    chunk = file.stream.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    if len(header) < 1024:
+                        header += chunk[:1024 - len(header)]
+                    digest.update(chunk)
+                    f.write(chunk)
+
+            file_hash = digest.hexdigest()
+            relative_path = f"{file_hash[:2]}/{file_hash[2:4]}/{file_hash}{self.sniff_extension(header)}"
+            final_path = os.path.join(self.folder, relative_path)
+            if os.path.exists(final_path):
+                # 相同内容已经存在，丢弃这次的临时文件
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.replace(tmp_path, final_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return relative_path
+
+    @staticmethod
+    def content_hash(relative_path):
+        """如果是内容寻址的路径则返回其哈希，否则返回None（旧的时间戳文件名）"""
+        match = HASHED_PATH_RE.match(relative_path)
+        return match.group(3) if match else None
+
+class VariantService:
+    """按需生成上传图片的缩小版本（可转为WebP）
+
+    第一次请求某个宽度/格式时在有界线程池中生成，保存在原图旁边
+    （{原文件名}.w{宽度}.{格式}，只转换格式时为 {原文件名}.full.{格式}），之后直接读取磁盘上的文件。
+    宽度会向上取到 widths 中最接近的档位，避免任意宽度把磁盘占满；
+    同一版本的并发请求只生成一次，超过 timeout 秒仍未生成完则先返回原图。
+    """
+
+    FORMATS = {"webp": ("WEBP", ".webp"), "jpeg": ("JPEG", ".jpg"), "png": ("PNG", ".png")}
+
+    def __init__(self, store, widths=(64, 128, 256, 512, 1024), workers=2, timeout=10, quality=80):
+        self.store = store
+        self.widths = tuple(sorted(widths))
+        self.workers = workers
+        self.timeout = timeout
+        self.quality = quality
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self._pending = {}  # 正在生成的版本文件 -> Future
+
+    def init_app(self, app):
+        """从应用配置中读取宽度档位、线程数和超时时间"""
+        self.widths = tuple(sorted(app.config.get('UPLOAD_VARIANT_WIDTHS', self.widths)))
+        self.workers = app.config.get('UPLOAD_VARIANT_WORKERS', self.workers)
+        self.timeout = app.config.get('UPLOAD_VARIANT_TIMEOUT', self.timeout)
+        with self._lock:
+            self._executor = None
+
+    @property
+    def enabled(self):
+        return Image is not None
+
+    @property
+    def executor(self):
+        """生成缩略图的有界线程池，fork 后的子进程重新创建"""
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers,
+                        thread_name_prefix="upload-variant"
+                    )
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def bucket(self, width):
+        """把请求的宽度向上取到最近的档位"""
+        for candidate in self.widths:
+            if width <= candidate:
+                return candidate
+        return self.widths[-1]
+
+    def variant_path(self, relative_path, width, fmt):
+        """版本文件相对于上传目录的路径，只转换格式（width 为None）时为 {原文件名}.full.{格式}"""
+        stem, ext = os.path.splitext(relative_path)
+        if fmt:
+            ext = self.FORMATS[fmt][1]
+        size = f"w{width}" if width else "full"
+        return f"{stem}.{size}{ext}"
+
+    def _render(self, source, target, width, fmt):
+        """缩放图片并原子地写入目标文件"""
+        with Image.open(source) as image:
+            pil_format = self.FORMATS[fmt][0] if fmt else image.format
+            if width and image.width > width:
+                height = max(1, round(image.height * width / image.width))
+                image = image.resize((width, height), Image.LANCZOS)
+            if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".tmp-")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    image.save(f, format=pil_format, quality=self.quality)
+                os.replace(tmp_path, target)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        return target
+
+    def get(self, relative_path, width=None, fmt=None):
+        """返回指定宽度/格式版本的相对路径，无法生成时返回None（使用原图）
+
+        Args:
+            relative_path: 原图相对于上传目录的路径，必须是内容寻址的路径
+            width: 期望的最大宽度，None表示保持原图宽度
+            fmt: 目标格式 webp/jpeg/png，None表示保持原格式
+        """
+        if not self.enabled or (width is None and fmt is None):
+            return None
+        if fmt is not None and fmt not in self.FORMATS:
+            return None
+        # 只从内容寻址的原图生成，版本文件（{hash}.w128.png 等）和旧文件名都不能作为来源，
+        # 否则可以不断生成“版本的版本”占满磁盘
+        if self.store.content_hash(relative_path) is None:
+            return None
+
+        source = safe_join(self.store.folder, relative_path)
+        if source is None or not os.path.isfile(source):
+            return None
+
+        # 只转换格式时保持原图尺寸
+        width = self.bucket(width) if width else None
+        variant = self.variant_path(relative_path, width, fmt)
+        target = os.path.join(self.store.folder, variant)
+        if os.path.exists(target):
+            return variant
+
+        # 同一版本的并发请求共用一个生成任务
+        executor = self.executor
+        with self._lock:
+            future = self._pending.get(target)
+            if future is None:
+                future = executor.submit(self._render, source, target, width, fmt)
+                self._pending[target] = future
+                future.add_done_callback(lambda _: self._pending.pop(target, None))
+        try:
+            future.result(timeout=self.timeout)
+        except TimeoutError:
+            # 还没生成完，先返回原图，生成结果会留在磁盘上供下次使用
+            return None
+        except Exception as e:
+            print(f"生成图片缩略图失败: {str(e)}")
+            return None
+        return variant
+
+# 创建默认存储实例
+upload_store = UploadStore()
+upload_variants = VariantService(upload_store)
@@ -0,0 +1,162 @@
+# write_behind.py - 批量延迟写入队列
+import atexit
+import os
+import queue
+import threading
+import time
+
+from database import db
+from metrics import metrics
+
+class QueueFull(Exception):
+    """写入队列已满，调用方应返回429让客户端稍后重试"""
+
+class WriteBehindQueue:
+    """有界内存队列 + 后台写线程
+
+    请求校验通过后把参数放入队列即可返回，后台线程攒够 batch_size 条
+    或最早一条等待超过 flush_interval 秒时，用 executemany 在一个事务里写入，
+    把每条一次提交（fsync）变成每批一次。队列满时 submit 抛出 QueueFull；
+    进程退出时（atexit / gunicorn worker_exit）把剩余的数据写完。
+
+    队列和写线程按进程创建，fork 后的子进程各自拥有自己的队列。
+    """
+
+    def __init__(self, name, sql, max_size=1000, batch_size=100, flush_interval=0.2, retries=3):
+        self.name = name
+        self.sql = sql
+        self.enabled = False
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.on_flush = None  # 每批写入提交后调用，参数为本批的参数列表
+        self._queue = None
+        self._thread = None
+        self._stopping = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """从应用配置中读取 {NAME}_WRITE_BEHIND、_QUEUE_SIZE、_BATCH_SIZE、_FLUSH_INTERVAL"""
+        prefix = self.name.upper()
+        self.enabled = app.config.get(f'{prefix}_WRITE_BEHIND', self.enabled)
+        self.max_size = app.config.get(f'{prefix}_QUEUE_SIZE', self.max_size)
+        self.batch_size = app.config.get(f'{prefix}_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get(f'{prefix}_FLUSH_INTERVAL', self.flush_interval)
+        metrics.register_gauge(f"write_behind.{self.name}.depth", self.depth)
+
+    def depth(self):
+        """当前进程队列中等待写入的条数"""
+        q = self._queue
+        return q.qsize() if q is not None and self._pid == os.getpid() else 0
+
+    def _ensure_started(self):
+        """按进程创建队列并启动写线程，写线程意外退出时重新启动"""
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.max_size)
+                self._stopping = threading.Event()
+                self._thread = None
+                self._pid = os.getpid()
+                atexit.register(self.drain)
+            if self._thread is None or (not self._thread.is_alive() and not self._stopping.is_set()):
+                if self._thread is not None:
+                    print(f"{self.name} 写线程已退出，重新启动")
+                    metrics.incr(f"write_behind.{self.name}.restarts")
+                self._thread = threading.Thread(target=self._run, name=f"write-behind-{self.name}", daemon=True)
+                self._thread.start()
+
+    def submit(self, params):
+        """放入一条待写入的参数，队列已满时抛出 QueueFull"""
+        self._ensure_started()
+        if self._stopping.is_set():
+            raise QueueFull(f"{self.name} 写入队列正在关闭")
+        try:
+            self._queue.put_nowait(params)
+        except queue.Full:
+            metrics.incr(f"write_behind.{self.name}.rejected")
+            raise QueueFull(f"{self.name} 写入队列已满")
+        metrics.incr(f"write_behind.{self.name}.queued")
+
+    def _collect(self):
+        """取出一批：阻塞等待第一条，之后最多再等 flush_interval 秒或攒满 batch_size 条"""
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        """在一个事务中写入一批，数据库繁忙时重试"""
+        for attempt in range(1, self.retries + 1):
+            conn = None
+            try:
+                conn = db.pool.acquire()
+                cur = conn.cursor()
+                cur.execute("BEGIN IMMEDIATE")
+                cur.executemany(self.sql, batch)
+                conn.commit()
+                metrics.incr(f"write_behind.{self.name}.written", len(batch))
+                metrics.incr(f"write_behind.{self.name}.batches")
+                break
+            except Exception as e:
+                if conn is not None:
+                    try:
+                        conn.rollback()
+                    except Exception:
+                        pass
+                print(f"批量写入{self.name}错误（第{attempt}次）: {str(e)}")
+                if attempt == self.retries:
+                    metrics.incr(f"write_behind.{self.name}.dropped", len(batch))
+                    return
+                time.sleep(0.1 * attempt)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+        if self.on_flush is not None:
+            try:
+                self.on_flush(batch)
+            except Exception as e:
+                print(f"{self.name} 写入回调错误: {str(e)}")
+
+    def _run(self):
+        """写线程：持续取出并写入，收到停止信号后写完队列中剩余的数据再退出"""
+        while True:
+            try:
+                batch = self._collect()
+                if batch:
+                    self._write(batch)
+                elif self._stopping.is_set():
+                    return
+            except Exception as e:
+                # 不能让写线程因意外错误退出，否则之后提交的数据都会留在队列中
+                print(f"{self.name} 写线程错误: {str(e)}")
+                time.sleep(0.1)
+
+    def drain(self, timeout=10):
+        """停止接收新数据，等待写线程写完队列中剩余的数据"""
+        if self._pid != os.getpid() or self._stopping.is_set():
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            print(f"{self.name} 写入队列在 {timeout} 秒内未写完，剩余 {self.depth()} 条")
+
+# 棉花糖的延迟写入队列，参数为 (sender, title, content, create_time)
+cotton_candy_queue = WriteBehindQueue(
+    "cotton_candy",
+    "INSERT INTO cotton_candy (sender, title, content, create_time, read) VALUES (?, ?, ?, ?, 0)"
+)
@@ -92,6 +92,17 @@ function App() {
     return () => clearTimeout(timer);
   }, [isAdmin, isLoggedIn, location.pathname]);
 
+  useEffect(() => {
+    // 管理员订阅棉花糖事件推送，实时更新未读数量
+    if (!isAdmin || typeof EventSource === 'undefined') return undefined;
+    const source = new EventSource('/api/cotton_candy/events', { withCredentials: true });
+    source.onmessage = (event) => {
+      const data = JSON.parse(event.data);
+      setUnreadCandyCount(data.unread);
+    };
+    return () => source.close();
+  }, [isAdmin]);
+
   const checkAuth = async () => {
     try {
       const res = await axios.get('/api/check_auth', {
@@ -16,11 +16,34 @@ const secondaryGradient = 'linear-gradient(135deg, #352a46 0%, #261e36 100%)';
 const bgColor = '#1c2134';
 const textColor = '#e6d6bc';
 
+// 批量接口内联返回的头像保存在 localStorage 中，再次访问时直接显示，不再请求
+const FACE_CACHE_KEY = 'guardFaces';
+const FACE_BATCH_SIZE = 50;
+
+const loadCachedFaces = () => {
+  try {
+    return JSON.parse(localStorage.getItem(FACE_CACHE_KEY)) || {};
+  } catch (error) {
+    return {};
+  }
+};
+
+const saveCachedFaces = (faces) => {
+  try {
+    localStorage.setItem(FACE_CACHE_KEY, JSON.stringify(faces));
+  } catch (error) {
+    // 超出存储配额时不缓存，下次访问重新获取
+    console.error('缓存头像失败:', error);
+  }
+};
+
 function Intro() {
   const { isMobile } = useDeviceDetect();
   const [showCards, setShowCards] = useState(false);
   const [expandStory, setExpandStory] = useState(false);
   const [guards, setGuards] = useState([]);
+  const [guardFaces, setGuardFaces] = useState(loadCachedFaces); // 头像URL -> data URI
+  const [facesPending, setFacesPending] = useState(true); // 批量请求是否尚未完成
   const [loading, setLoading] = useState(false);
   const [expandedGuards, setExpandedGuards] = useState({});
   const [selectedGuard, setSelectedGuard] = useState(null);
@@ -37,6 +60,7 @@ function Intro() {
         }
         const data = await response.json();
         setGuards(data.guards || []);
+        fetchGuardFaces(data.guards || []);
       } catch (error) {
         console.error('获取舰长数据错误:', error);
         message.error('获取舰长数据失败');
@@ -45,9 +69,69 @@ function Intro() {
       }
     };
 
+    // 本地没有缓存的头像由批量接口一次获取，小头像直接内联返回；
+    // 各批并行请求，每批返回后立即显示，未内联的大图退回到逐张代理
+    const fetchGuardFaces = async (guardList) => {
+      const urls = [...new Set(guardList.map(guard => guard.face).filter(Boolean))];
+      const cached = loadCachedFaces();
+      const faces = {};
+      urls.forEach(url => {
+        if (cached[url]) {
+          faces[url] = cached[url];
+        }
+      });
+      const missing = urls.filter(url => !faces[url]);
+
+      const batches = [];
+      for (let i = 0; i < missing.length; i += FACE_BATCH_SIZE) {
+        batches.push(missing.slice(i, i + FACE_BATCH_SIZE));
+      }
+      await Promise.all(batches.map(async (batch) => {
+        try {
+          const response = await fetch('/api/proxy/images', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ urls: batch }),
+          });
+          if (!response.ok) {
+            throw new Error('批量获取头像失败');
+          }
+          const data = await response.json();
+          const received = {};
+          Object.entries(data.images || {}).forEach(([url, image]) => {
+            if (image.data) {
+              received[url] = `data:${image.content_type};base64,${image.data}`;
+            }
+          });
+          Object.assign(faces, received);
+          setGuardFaces(prev => ({ ...prev, ...received }));
+        } catch (error) {
+          // 批量获取失败时头像退回到逐张代理
+          console.error('批量获取头像错误:', error);
+        }
+      }));
+
+      // 只保留当前舰长的头像，避免缓存无限增长
+      saveCachedFaces(faces);
+      setGuardFaces(faces);
+      setFacesPending(false);
+    };
+
     fetchGuards();
   }, []);
 
+  // 获取舰长头像地址：优先使用内联的头像，批量请求完成前先显示占位，
+  // 之后没有内联的头像通过代理地址逐张获取（可被浏览器长期缓存）
+  const getGuardFaceSrc = (face) => {
+    if (!face) {
+      return null;
+    }
+    if (guardFaces[face]) {
+      return guardFaces[face];
+    }
+    return facesPending ? null : `/api/proxy/image?url=${encodeURIComponent(face)}`;
+  };
+
   // 获取舰长等级对应的标签颜色
   const getGuardLevelColor = (level) => {
     switch (level) {
@@ -1078,7 +1162,7 @@ function Intro() {
                     >
                       <Avatar 
                         size={94}
-                        src={guard.face ? `/api/proxy/image?url=${encodeURIComponent(guard.face)}` : null}
+                        src={getGuardFaceSrc(guard.face)}
                         style={{ 
                           border: `2px solid ${themeColor}22`,
                           transition: 'all 0.3s ease',
@@ -1307,7 +1391,7 @@ function Intro() {
           }}>
             <Avatar 
               size={48}
-              src={selectedGuard?.face ? `/api/proxy/image?url=${encodeURIComponent(selectedGuard.face)}` : null}
+              src={getGuardFaceSrc(selectedGuard?.face)}
               style={{
                 border: `2px solid ${selectedGuard ? getGuardLevelColor(selectedGuard.guard_level) : themeColor}`,
                 boxShadow: '0 0 10px rgba(0, 0, 0, 0.3)',
@@ -67,7 +67,11 @@ function LotteryWheel({ isLoggedIn }) {
         if (!res.ok) throw new Error('保存奖品信息失败');
         return res.json();
       })
-      .then(() => {
+      .then((data) => {
+        // 使用后端返回的奖品列表，新增奖品会带上 id，下次保存时原地更新
+        if (Array.isArray(data.prizes)) {
+          setPrizes(data.prizes);
+        }
         message.success('奖品信息已成功保存到后端');
       })
       .catch((err) => {
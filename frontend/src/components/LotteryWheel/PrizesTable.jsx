@@ -13,6 +13,11 @@ const secondaryGradient = 'linear-gradient(135deg, #352a46 0%, #261e36 100%)';
 const bgColor = '#1c2134';
 const textColor = '#e6d6bc';
 
+// 上传到本站的图片请求缩略图，外部图片保持原样
+const thumbnailSrc = (image) => (
+  image && image.startsWith('/uploads/') ? `${image}?w=128&format=webp` : image
+);
+
 // 这里也可以把图片上传逻辑放到容器里；
 // 如果要在这里写，就直接在组件里 fetch('/api/upload') 即可。
 // 为了简洁，演示时就直接写在 columns 里。
@@ -228,7 +233,7 @@ function PrizesTable({ prizes, setPrizes }) {
                       
                       {item.image && (
                         <img
-                          src={item.image}
+                          src={thumbnailSrc(item.image)}
                           alt="奖品图片"
                           style={{
                             width: 48,
@@ -324,7 +329,7 @@ function PrizesTable({ prizes, setPrizes }) {
 
             {val ? (
               <img
-                src={val}
+                src={thumbnailSrc(val)}
                 alt="奖品图片"
                 style={{
                   width: 48,